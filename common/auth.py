@@ -15,24 +15,173 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import flask_login
+from flask import g
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from sqlalchemy.orm import make_transient_to_detached
 from common.db import db
-from models.user import User
+from common.cache import credential_cache
+from models.user import User, Role
+import hashlib
 import logging
+import secrets
+import hmac
+import os
 
 logger = logging.getLogger("label-api")
 
 login_manager = flask_login.LoginManager()
 
+# Key used to digest the secrets stored in the credential cache. It is random
+# per process, just like the cache itself, so plain text secrets never end up
+# in memory for longer than the request.
+_credential_digest_key = secrets.token_bytes(32)
+
+
+def _credential_cache_key(api_key, api_secret):
+    digest = hmac.new(
+        _credential_digest_key,
+        api_secret.encode(),
+        hashlib.sha256
+    ).digest()
+    return api_key, digest
+
+
+def check_credentials(user, api_key, api_secret):
+    """
+    Check the provided secret against the stored (hashed) secret of the user.
+    Successful checks are kept in the credential cache, so the expensive
+    bcrypt check is only done once per TTL.
+
+    :param user:        The user found for the API key
+    :param api_key:     The provided API key
+    :param api_secret:  The provided API secret, in plain text
+    :returns:           Boolean indicating if the secret is valid
+    """
+    key = _credential_cache_key(api_key, api_secret)
+
+    # The hashed secret is stored along with the user id, so that a secret that
+    # has been changed by another process is not accepted from the cache
+    cached = credential_cache.get(key)
+    if cached is not None and cached[0] == user.id \
+            and hmac.compare_digest(cached[1], bytes(user.API_SECRET)):
+        return True
+
+    if not user.check_password(api_secret):
+        return False
+
+    credential_cache.set(key, (user.id, bytes(user.API_SECRET)))
+    return True
+
+
+def _access_token_serializer():
+    """
+    Get the serializer used to sign and verify access tokens, or None if no
+    signing secret is configured.
+
+    Requires the following environment variables to be set:
+    ACCESS_TOKEN_SECRET
+    """
+    secret = os.environ.get("ACCESS_TOKEN_SECRET")
+    if not secret:
+        return None
+
+    return URLSafeTimedSerializer(
+        secret,
+        salt="access-token",
+        signer_kwargs={"digest_method": hashlib.sha256}
+    )
+
+
+def _access_token_valid_seconds():
+    return int(os.environ.get("ACCESS_TOKEN_VALID_SECONDS", 900))
+
+
+def create_access_token(user):
+    """
+    Create a signed access token for a user. The token contains the user id,
+    email and a snapshot of the roles of the user, so that it can be used to
+    authenticate without consulting the database.
+
+    :param user:    The user to create the token for
+    :returns:       Tuple containing the token and the number of seconds it
+                    is valid, or (None, None) if access tokens are not
+                    configured
+    """
+    serializer = _access_token_serializer()
+    if serializer is None:
+        return None, None
+
+    token = serializer.dumps({
+        "uid": user.id,
+        "email": user.email,
+        "roles": [
+            [x.id, x.role, x.subject_type, x.subject_id]
+            for x in user.roles
+        ]
+    })
+
+    logger.info("Created access token for %s" % user.email)
+    return token, _access_token_valid_seconds()
+
+
+def load_access_token(token):
+    """
+    Verify an access token and rebuild the user it was issued to. The user and
+    roles are attached to the session as if they were loaded from the
+    database, without emitting any queries.
+
+    NOTE: As the database is not consulted, disabling a user or changing
+          their roles only takes effect once their tokens have expired.
+
+    :param token:   The token as provided in the Authorization header
+    :returns:       The user, or None if the token is invalid or expired
+    """
+    serializer = _access_token_serializer()
+    if serializer is None:
+        return None
+
+    try:
+        claims = serializer.loads(token, max_age=_access_token_valid_seconds())
+    except BadSignature:
+        logger.warning("Invalid or expired access token")
+        return None
+
+    user = User(id=claims["uid"], email=claims["email"], enabled=True)
+    user.roles = [
+        Role(
+            id=role_id,
+            role=role,
+            user_id=user.id,
+            subject_type=subject_type,
+            subject_id=subject_id
+        )
+        for role_id, role, subject_type, subject_id in claims["roles"]
+    ]
+    for role in user.roles:
+        make_transient_to_detached(role)
+    make_transient_to_detached(user)
+
+    return db.session.merge(user, load=False)
+
 
 @login_manager.request_loader
 def request_loader(request):
+    # Signed access token, obtained through POST /auth/token
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        user = load_access_token(authorization[len("Bearer "):].strip())
+        g.authenticated_with_token = user is not None
+        return user
+
     api_key = request.headers.get("Authentication-Key")
     api_secret = request.headers.get("Authentication-Secret")
+    if not api_key or not api_secret:
+        return None
 
     # Validate key against DB, return user
-    user = db.session.query(User).filter_by(API_KEY=api_key).first()
-    if user is not None and api_secret and user.is_active() \
-            and user.check_password(api_secret):
+    user = User.find_by_api_key(api_key)
+    if user is not None and user.is_active() \
+            and check_credentials(user, api_key, api_secret):
         return user
 
     return None  # Not a User or invalid key, return None == Unauthenticated
@@ -27,18 +27,67 @@ from azureml._restclient.models.error_response import ErrorResponseException
 from msrest.exceptions import AuthenticationError
 from PIL import Image, UnidentifiedImageError
 from retrying import retry
+from common.cache import azure_ml_cache
+from common.prometheus import azure_ml_cache_refreshes
 from datetime import datetime, timedelta
-from pathlib import Path
+from threading import Lock
 import logging
+import requests
 import os
 import io
-import pandas as pd
+import json
+import time
+import base64
+import csv
+import tempfile
 import string
 
 logger = logging.getLogger("label-api")
 
+# Shared BlockBlobService and the id of the process that created it, see
+# AzureWrapper._get_blob_service
+_blob_service = None
+_blob_service_lock = Lock()
+
 
 class AzureWrapper:
+    @staticmethod
+    def _get_blob_service():
+        """
+        Get the BlockBlobService of this process. It is created on first use
+        and then shared by all threads, so the connection string is parsed
+        only once and connections to the storage account are kept open in a
+        pool of AZURE_STORAGE_POOL_SIZE connections. The service is created
+        again in a forked process, as connections can't be shared between
+        processes.
+
+        :returns:   BlockBlobService object
+        """
+        global _blob_service
+
+        pid = os.getpid()
+        service = _blob_service
+        if service is not None and service[0] == pid:
+            return service[1]
+
+        with _blob_service_lock:
+            if _blob_service is None or _blob_service[0] != pid:
+                pool_size = int(os.environ.get("AZURE_STORAGE_POOL_SIZE", 10))
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+
+                _blob_service = (pid, BlockBlobService(
+                    connection_string=os.environ[
+                        "AZURE_STORAGE_CONNECTION_STRING"],
+                    request_session=session
+                ))
+            return _blob_service[1]
+
     @staticmethod
     def check_name(name):
         """
@@ -115,9 +164,7 @@ class AzureWrapper:
                                 "delete", "read", "write"].
         :returns:               The URL with key for the given image.
         """
-        block_blob_service = BlockBlobService(
-            connection_string=os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-        )
+        block_blob_service = AzureWrapper._get_blob_service()
 
         # Determine container and filepath
         path = path.lstrip("/")
@@ -160,9 +207,7 @@ class AzureWrapper:
                                 "read", "write"].
         :returns:               The URL with key for the given image.
         """
-        block_blob_service = BlockBlobService(
-            connection_string=os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-        )
+        block_blob_service = AzureWrapper._get_blob_service()
 
         token = block_blob_service.generate_container_shared_access_signature(
             container_name,
@@ -203,9 +248,7 @@ class AzureWrapper:
         :returns:               False in case of failure, container name
                                 otherwise
         """
-        block_blob_service = BlockBlobService(
-            connection_string=os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-        )
+        block_blob_service = AzureWrapper._get_blob_service()
 
         container_name = "dropbox-" + container_name.lower()
         try:
@@ -233,9 +276,7 @@ class AzureWrapper:
         :param target_folder:       Folder to copy to, as prefix
         :returns:                   List of all copied files
         """
-        block_blob_service = BlockBlobService(
-            connection_string=os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-        )
+        block_blob_service = AzureWrapper._get_blob_service()
 
         try:
             files = block_blob_service.list_blobs(source_container,
@@ -275,9 +316,7 @@ class AzureWrapper:
         :param container:    Container to delete
         :returns:            Boolean indicating success
         """
-        block_blob_service = BlockBlobService(
-            connection_string=os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-        )
+        block_blob_service = AzureWrapper._get_blob_service()
 
         try:
             block_blob_service.delete_container(container)
@@ -301,9 +340,7 @@ class AzureWrapper:
         :returns:           Tuple containing: image type, image width,
                             image height
         """
-        block_blob_service = BlockBlobService(
-            connection_string=os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-        )
+        block_blob_service = AzureWrapper._get_blob_service()
 
         path = path.lstrip("/")
         container = path.split("/")[0]
@@ -330,40 +367,90 @@ class AzureWrapper:
 
             return img.format, img.width, img.height
 
+    @staticmethod
+    def _get_token_ttl(auth):
+        """
+        Determine how long a workspace can be used, based on the expiry of
+        the access token of its authentication. The token is refreshed
+        AZURE_ML_TOKEN_REFRESH_MARGIN_SECONDS before it expires.
+
+        :param auth:    Azure ML authentication object
+        :returns:       Number of seconds, or None if the expiry is unknown
+        """
+        try:
+            header = auth.get_authentication_header()["Authorization"]
+            payload = header.split(" ")[1].split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            expires = json.loads(base64.urlsafe_b64decode(payload))["exp"]
+        except Exception as e:
+            logger.warning(f"Unable to determine token expiry: {e}")
+            return None
+
+        margin = int(os.environ.get(
+            "AZURE_ML_TOKEN_REFRESH_MARGIN_SECONDS", 300))
+        return max(expires - time.time() - margin, 0)
+
     @staticmethod
     def _get_workspace(subscription_id, resource_group, workspace_name):
         """
-        Load the correct workspace
+        Load the correct workspace. Workspaces are cached per process, as
+        loading one logs in to Azure. A cached workspace is used for at most
+        AZURE_ML_CACHE_TTL_SECONDS, and not after its access token expires.
 
         :param subscription_id:     Azure subscription
         :param resource_group:      Azure resource group
         :param workspace_name:      Name of the workspace
         :returns:                   Azure ML Workspace object
         """
+        key = ("workspace", subscription_id, resource_group, workspace_name)
+        workspace = azure_ml_cache.get(key)
+        if workspace is not None:
+            return workspace
+
+        # With caching, the token obtained while loading the workspace is
+        # reused to read its expiry, instead of logging in again
         service_principal = ServicePrincipalAuthentication(
             tenant_id=os.environ["AZURE_ML_SP_TENANT_ID"],
             service_principal_id=os.environ["AZURE_ML_SP_APPLICATION_ID"],
             service_principal_password=os.environ["AZURE_ML_SP_PASSWORD"],
-            _enable_caching=False
+            _enable_caching=True
         )
 
-        return Workspace(
+        workspace = Workspace(
             subscription_id,
             resource_group,
             workspace_name,
             auth=service_principal
         )
+        azure_ml_cache_refreshes.inc()
+
+        ttl = AzureWrapper._get_token_ttl(service_principal)
+        if ttl is not None:
+            ttl = min(ttl, azure_ml_cache.ttl)
+        azure_ml_cache.set(key, workspace, ttl=ttl)
+        return workspace
 
     @staticmethod
     def _get_datastore(workspace, datastore_name):
         """
-        Get a Datastore object
+        Get a Datastore object. Datastores are cached per workspace object,
+        so a datastore is loaded again when its workspace is refreshed.
 
         :param workspace:       Azure ML Workspace object
         :param datastore_name:  Name of the datastore to load
         :returns:               Azure ML Datastore object
         """
-        return Datastore.get(workspace, datastore_name)
+        # The cached datastore refers to the workspace, so the id of the
+        # workspace can't be reused while the entry exists
+        key = ("datastore", id(workspace), datastore_name)
+        datastore = azure_ml_cache.get(key)
+        if datastore is not None:
+            return datastore
+
+        datastore = Datastore.get(workspace, datastore_name)
+        azure_ml_cache_refreshes.inc()
+        azure_ml_cache.set(key, datastore)
+        return datastore
 
     @staticmethod
     @retry(stop_max_attempt_number=5, wait_exponential_multiplier=1000, wait_exponential_max=10000)
@@ -464,30 +551,16 @@ class AzureWrapper:
 
         :param name:        The name to give to the new dataset
         :param description: Short description to give to the dataset
-        :param labels:      A list of image paths relative to the datastore
-                            object in Azure ML.
+        :param labels:      Iterable of dicts with "image_url" (relative to
+                            the datastore object in Azure ML), "label" and
+                            "label_confidence". It is consumed only once, so
+                            it can be a generator.
         """
         ws = AzureWrapper._get_workspace(
             os.environ["AZURE_ML_SUBSCRIPTION_ID"],
             os.environ["AZURE_ML_RESOURCE_GROUP"],
             os.environ["AZURE_ML_WORKSPACE_NAME"]
         )
-        data = []
-        for image in labels:
-            data.append([
-                image["image_url"],
-                image["label"],
-                image["label_confidence"]
-            ])
-
-        columns = ["image_url", "label", "label_confidence"]
-        df = pd.DataFrame(data, columns=columns)
-        Path("tmp").mkdir(parents=True, exist_ok=True)
-        local_path = f"tmp/{name}.csv"
-        df.to_csv(local_path, index=False)
-
-        logger.info(f"Created local file")
-
         datastore = AzureWrapper._get_datastore(
             ws,
             os.environ["AZURE_ML_DATASTORE"]
@@ -495,8 +568,30 @@ class AzureWrapper:
 
         logger.info(f"Got Datastore {datastore}")
 
-        # upload the local file from src_dir to the target_path in datastore
-        datastore.upload(src_dir="tmp", target_path="label_sets")
+        # Write the labels to a CSV file in a directory of this export only,
+        # one row at a time, and upload just that file. The label columns are
+        # written in the same representation as before (str of the lists).
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = os.path.join(tmp_dir, f"{name}.csv")
+            with open(local_path, "w", newline="") as f:
+                writer = csv.writer(f, lineterminator="\n")
+                writer.writerow(["image_url", "label", "label_confidence"])
+                for image in labels:
+                    writer.writerow([
+                        image["image_url"],
+                        str(image["label"]),
+                        str(image["label_confidence"])
+                    ])
+
+            logger.info(f"Created local file")
+
+            # Overwrite, so a retried export replaces a previous upload
+            datastore.upload_files(
+                files=[local_path],
+                relative_root=tmp_dir,
+                target_path="label_sets",
+                overwrite=True
+            )
 
         logger.info(
             f'Uploaded labels CSV to {os.environ["AZURE_ML_DATASTORE"]}'
@@ -515,7 +610,42 @@ class AzureWrapper:
 
         logger.info("Registered dataset")
 
-        os.remove(local_path)
+    @staticmethod
+    def upload_to_datastore(files, relative_root, target_path):
+        """
+        Upload local files to the Azure ML datastore. Existing files are
+        overwritten.
+
+        Requires the following environment variables to be set:
+        AZURE_ML_DATASTORE
+        AZURE_ML_SUBSCRIPTION_ID
+        AZURE_ML_RESOURCE_GROUP
+        AZURE_ML_WORKSPACE_NAME
+
+        :param files:           List of paths of the local files
+        :param relative_root:   Local directory the paths in the datastore are
+                                made relative to
+        :param target_path:     Folder in the datastore to upload to
+        """
+        ws = AzureWrapper._get_workspace(
+            os.environ["AZURE_ML_SUBSCRIPTION_ID"],
+            os.environ["AZURE_ML_RESOURCE_GROUP"],
+            os.environ["AZURE_ML_WORKSPACE_NAME"]
+        )
+        datastore = AzureWrapper._get_datastore(
+            ws,
+            os.environ["AZURE_ML_DATASTORE"]
+        )
+        datastore.upload_files(
+            files=files,
+            relative_root=relative_root,
+            target_path=target_path,
+            overwrite=True
+        )
+
+        logger.info(
+            f'Uploaded {len(files)} files to '
+            f'{os.environ["AZURE_ML_DATASTORE"]}/{target_path}')
 
     @staticmethod
     def check_storage_connect():
@@ -541,9 +671,7 @@ class AzureWrapper:
         """
         Check if the required container exists.
         """
-        block_blob_service = BlockBlobService(
-            connection_string=os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-        )
+        block_blob_service = AzureWrapper._get_blob_service()
         container_name = os.environ["AZURE_STORAGE_IMAGESET_CONTAINER"]
         if block_blob_service.exists(container_name):
             return True, None
@@ -571,9 +699,7 @@ class AzureWrapper:
 
     @staticmethod
     def check_create_blob():
-        block_blob_service = BlockBlobService(
-            connection_string=os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-        )
+        block_blob_service = AzureWrapper._get_blob_service()
         container_name = os.environ["AZURE_STORAGE_IMAGESET_CONTAINER"]
         blob_name = 'tmp-blob-status-check'
         try:
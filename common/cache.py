@@ -0,0 +1,170 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from threading import Lock
+from common.prometheus import credential_cache_hits, \
+    credential_cache_misses, azure_ml_cache_hits
+import time
+import os
+
+
+class TTLCache:
+    """
+    Small in-process cache. Every entry expires after a time-to-live, and when
+    the cache is full the least recently used entry is evicted. All operations
+    are guarded by a lock, so a single cache can be shared between the threads
+    of a gunicorn worker.
+
+    Note that the cache is per process: invalidating an entry only affects
+    the current worker, the other workers rely on the time-to-live.
+    """
+
+    def __init__(self, ttl, maxsize=1024, hits=None, misses=None):
+        """
+        :param ttl:     Default time-to-live of an entry, in seconds. A value
+                        of 0 or lower disables the cache.
+        :param maxsize: Maximum number of entries to keep.
+        :param hits:    Optional Prometheus counter to increment on a hit.
+        :param misses:  Optional Prometheus counter to increment on a miss.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = hits
+        self.misses = misses
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key):
+        """
+        Get a value from the cache.
+
+        :param key:     The key to look up
+        :returns:       The cached value, or None if not present or expired
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None:
+            if self.misses is not None:
+                self.misses.inc()
+            return None
+
+        if self.hits is not None:
+            self.hits.inc()
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value in the cache.
+
+        :param key:     The key to store the value under
+        :param value:   The value to store. Storing None is pointless, as it
+                        can't be told apart from a miss.
+        :param ttl:     Optional time-to-live in seconds, overriding the
+                        default of the cache.
+        """
+        if not self.enabled:
+            return
+
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_matching(self, predicate):
+        """
+        Delete all entries for which predicate(key) is True.
+        """
+        with self._lock:
+            for key in [x for x in self._entries if predicate(x)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Verified API key/secret combinations, see common.auth.request_loader
+credential_cache = TTLCache(
+    int(os.environ.get("CREDENTIAL_CACHE_TTL_SECONDS", 300)),
+    maxsize=int(os.environ.get("CREDENTIAL_CACHE_SIZE", 1024)),
+    hits=credential_cache_hits,
+    misses=credential_cache_misses
+)
+
+# Total number of results of paginated queries, see common.pagination.count
+count_cache = TTLCache(
+    int(os.environ.get("COUNT_CACHE_TTL_SECONDS", 30)),
+    maxsize=int(os.environ.get("COUNT_CACHE_SIZE", 1024))
+)
+
+# Azure ML workspace and datastore handles, see AzureWrapper._get_workspace
+azure_ml_cache = TTLCache(
+    int(os.environ.get("AZURE_ML_CACHE_TTL_SECONDS", 3000)),
+    maxsize=16,
+    hits=azure_ml_cache_hits
+)
+
+
+def sas_url_ttl():
+    """
+    Time-to-live of signed download URLs in sas_url_cache, in seconds:
+    SAS_URL_CACHE_REFRESH_FRACTION of IMAGE_READ_TOKEN_VALID_DAYS. The
+    fraction is clamped to [0, 1], so a URL is never served after its token
+    expired.
+    """
+    valid_days = int(os.environ.get("IMAGE_READ_TOKEN_VALID_DAYS", 7))
+    fraction = float(os.environ.get("SAS_URL_CACHE_REFRESH_FRACTION", 0.5))
+    return valid_days * 86400 * min(max(fraction, 0), 1)
+
+
+# Signed download URLs of images, see Image.get_azure_url
+sas_url_cache = TTLCache(
+    sas_url_ttl(),
+    maxsize=int(os.environ.get("SAS_URL_CACHE_SIZE", 10000))
+)
+
+
+def clear_caches():
+    """
+    Clear all process-wide caches.
+    """
+    credential_cache.clear()
+    count_cache.clear()
+    azure_ml_cache.clear()
+    sas_url_cache.clear()
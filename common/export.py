@@ -0,0 +1,151 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Writers for the export formats of finished campaigns. The writers take an
+iterable of objects, as generated by Campaign.iter_objects, and consume it
+only once, so the objects can be streamed from the database.
+"""
+
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import tempfile
+import shutil
+import json
+import os
+
+# Columns of the Parquet export, one row per object. Images without objects
+# get a single row in which the object columns are null, so they remain part
+# of the dataset.
+PARQUET_SCHEMA = pa.schema([
+    ("image_id", pa.int64()),
+    ("image_url", pa.string()),
+    ("width", pa.int32()),
+    ("height", pa.int32()),
+    ("object_id", pa.int64()),
+    ("label", pa.string()),
+    ("label_original", pa.string()),
+    ("confidence", pa.float64()),
+    ("x_min", pa.int32()),
+    ("x_max", pa.int32()),
+    ("y_min", pa.int32()),
+    ("y_max", pa.int32())
+])
+
+
+def write_coco(path, objects, description):
+    """
+    Write objects as a COCO object detection dataset. The images are written
+    directly, while the annotations are spooled to a temporary file, as they
+    come after the images in the same document. Categories are numbered in
+    order of appearance of the labels.
+
+    :param path:        Path of the JSON file to write
+    :param objects:     Iterable of object dicts, ordered by image
+    :param description: Description of the dataset
+    """
+    categories = {}
+    with open(path, "w") as f, tempfile.TemporaryFile("w+") as annotations:
+        f.write('{"info": ')
+        json.dump({
+            "description": description,
+            "date_created": datetime.utcnow().isoformat()
+        }, f)
+        f.write(', "images": [')
+
+        image_id = None
+        for x in objects:
+            if x["image_id"] != image_id:
+                if image_id is not None:
+                    f.write(", ")
+                image_id = x["image_id"]
+                json.dump({
+                    "id": x["image_id"],
+                    "file_name": x["image_url"],
+                    "width": x["width"],
+                    "height": x["height"]
+                }, f)
+
+            if x["object_id"] is None:
+                continue
+
+            if annotations.tell() > 0:
+                annotations.write(", ")
+            width = x["x_max"] - x["x_min"]
+            height = x["y_max"] - x["y_min"]
+            json.dump({
+                "id": x["object_id"],
+                "image_id": x["image_id"],
+                "category_id": categories.setdefault(
+                    x["label"], len(categories) + 1),
+                "bbox": [x["x_min"], x["y_min"], width, height],
+                "area": width * height,
+                "iscrowd": 0,
+                "score": x["confidence"]
+            }, annotations)
+
+        f.write('], "annotations": [')
+        annotations.seek(0)
+        shutil.copyfileobj(annotations, f)
+        f.write('], "categories": ')
+        json.dump([
+            {"id": category_id, "name": name}
+            for name, category_id in categories.items()
+        ], f)
+        f.write("}")
+
+
+def write_parquet(path, objects, description):
+    """
+    Write objects as a Parquet file with the columns of PARQUET_SCHEMA. Rows
+    are written in row groups of EXPORT_BATCH_SIZE objects. Images without
+    objects are kept as a row in which the object columns are null, so the
+    file contains the same images as the COCO export.
+
+    :param path:        Path of the Parquet file to write
+    :param objects:     Iterable of object dicts
+    :param description: Description of the dataset, stored in the metadata
+                        of the file
+    """
+    schema = PARQUET_SCHEMA.with_metadata({"description": description})
+    batch_size = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+    def write_batch(writer, batch):
+        writer.write_table(pa.Table.from_pydict(
+            {name: [x[name] for x in batch] for name in schema.names},
+            schema=schema
+        ))
+
+    writer = pq.ParquetWriter(path, schema)
+    try:
+        batch = []
+        for x in objects:
+            batch.append(x)
+            if len(batch) == batch_size:
+                write_batch(writer, batch)
+                batch = []
+        if batch:
+            write_batch(writer, batch)
+    finally:
+        writer.close()
+
+
+# File name and writer, by export format
+EXPORT_FORMATS = {
+    "coco": ("coco.json", write_coco),
+    "parquet": ("objects.parquet", write_parquet)
+}
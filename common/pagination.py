@@ -0,0 +1,156 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from common.cache import count_cache
+from flask import abort
+import base64
+import binascii
+import json
+
+
+def encode_cursor(after_id):
+    """
+    Create an opaque cursor, pointing to the results after a given ID.
+    """
+    data = json.dumps({"after_id": after_id}).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Get the ID a cursor points after.
+
+    :param cursor:  Cursor as created by encode_cursor
+    :returns:       The ID, or None if the cursor is invalid
+    """
+    try:
+        after_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        after_id = after_id["after_id"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    if not isinstance(after_id, int):
+        return None
+    return after_id
+
+
+def count(query, count_key=None):
+    """
+    Count the results of a query. If a key is provided, the count is cached
+    under this key for a short time (see common.cache.count_cache). Code that
+    changes the results of the query should delete the key from the cache.
+
+    :param query:       The query to count the results of
+    :param count_key:   Key to cache the count under, identifying the
+                        endpoint and filter of the query
+    :returns:           The number of results
+    """
+    if count_key is not None:
+        total = count_cache.get(count_key)
+        if total is not None:
+            return total
+
+    total = query.order_by(None).count()
+
+    if count_key is not None:
+        count_cache.set(count_key, total)
+    return total
+
+
+def paginate(query, column, page=1, per_page=10, after_id=None, cursor=None,
+             limit=None, include_total=None, count_key=None,
+             descending=False):
+    """
+    Paginate a query, ordered by a unique integer column (normally the ID).
+
+    By default, the results are paginated by page number, which runs an
+    OFFSET/LIMIT query. If after_id, cursor or limit is provided, keyset
+    pagination is used instead: every page continues after the last ID of
+    the previous page, which only needs a range scan on an index on the
+    column. The next page can be requested with the cursor provided in the
+    pagination data.
+
+    Aborts with 400 if the cursor is invalid, and with 404 if a page number
+    past the last page is requested.
+
+    :param query:       The query to paginate
+    :param column:      The column to order and paginate by. The items must
+                        have an attribute with the same name.
+    :param page:        Page to retrieve, for paginating by page number
+    :param per_page:    Number of results per page. Also used as limit for
+                        keyset pagination, if no limit is provided.
+    :param after_id:    Only retrieve results after this ID
+    :param cursor:      Cursor as provided in the pagination data of the
+                        previous page. Overrides after_id.
+    :param limit:       Number of results to retrieve with keyset pagination
+    :param include_total:   Whether to include the total number of results
+                        in the pagination data. Defaults to True when
+                        paginating by page number, and False otherwise.
+    :param count_key:   Key to cache the total number of results under, see
+                        count
+    :param descending:  Whether to order by the column in descending order.
+                        Keyset pagination then continues with the results
+                        before the last ID of the previous page.
+    :returns:           Tuple containing the list of items and a dict with
+                        pagination data.
+    """
+    order = column.desc() if descending else column
+
+    if after_id is None and cursor is None and limit is None:
+        # Retrieve one extra result, to know if there is a next page
+        items = query.order_by(order)\
+                     .limit(per_page + 1)\
+                     .offset((page - 1) * per_page)\
+                     .all()
+        if not items and page != 1:
+            abort(404)
+        has_next = len(items) > per_page
+
+        pagination = {
+            "page": page,
+            "pages": page,
+            "per_page": per_page,
+            "prev": (page - 1 if page > 1 else None),
+            "next": (page + 1 if has_next else None)
+        }
+        if include_total is None or include_total:
+            pagination["total"] = count(query, count_key)
+        return items[:per_page], pagination
+
+    if cursor is not None:
+        after_id = decode_cursor(cursor)
+        if after_id is None:
+            abort(400, "Invalid cursor")
+    if limit is None:
+        limit = per_page
+
+    total_query = query
+    if after_id is not None:
+        query = query.filter(
+            column < after_id if descending else column > after_id)
+
+    # Retrieve one extra result, to know if there is a next page
+    items = query.order_by(order).limit(limit + 1).all()
+    has_next = len(items) > limit
+    items = items[:limit]
+
+    pagination = {
+        "limit": limit,
+        "next": (encode_cursor(getattr(items[-1], column.key))
+                 if has_next else None)
+    }
+    if include_total:
+        pagination["total"] = count(total_query, count_key)
+    return items, pagination
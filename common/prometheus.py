@@ -35,3 +35,15 @@ number_of_unlabeled_images          = Gauge("label_storage_number_of_unlabeled_i
 total_storage_container_size        = Counter("label_storage_total_storage_container_size",
                                               "Total size of the storage container in the label storage",
                                               registry=registry)
+credential_cache_hits               = Counter("label_storage_credential_cache_hits",
+                                              "Number of requests authenticated from the credential cache",
+                                              registry=registry)
+credential_cache_misses             = Counter("label_storage_credential_cache_misses",
+                                              "Number of requests that required a full credential check",
+                                              registry=registry)
+azure_ml_cache_hits                 = Counter("label_storage_azure_ml_cache_hits",
+                                              "Number of Azure ML workspace and datastore handles reused from the cache",
+                                              registry=registry)
+azure_ml_cache_refreshes            = Counter("label_storage_azure_ml_cache_refreshes",
+                                              "Number of Azure ML workspace and datastore handles (re)loaded from Azure",
+                                              registry=registry)
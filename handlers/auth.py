@@ -0,0 +1,46 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from common.auth import flask_login, create_access_token
+from flask import abort, g
+import logging
+
+logger = logging.getLogger("label-api")
+
+
+@flask_login.login_required
+def create_token():
+    """
+    POST /auth/token
+
+    Exchange an API key and secret for a short-lived access token.
+
+    Note: An access token can not be used to obtain a new one, otherwise a
+    disabled user could keep extending their access.
+    """
+    if g.get("authenticated_with_token", False):
+        logger.warning("Trying to exchange an access token for a new one")
+        abort(401)
+
+    token, expires_in = create_access_token(flask_login.current_user)
+    if token is None:
+        abort(503, "Access tokens are not configured on this server")
+
+    return {
+        "access_token": token,
+        "token_type": "Bearer",
+        "expires_in": expires_in
+    }
@@ -16,15 +16,29 @@
 
 from common.auth import flask_login
 from common.azure import AzureWrapper
+from common.db import db
+from common.pagination import paginate
 from models.campaign import Campaign, CampaignImage
-from flask import abort
+from models.image import Image
+from models.object import Object
+from connexion.json_schema import Draft4RequestValidator
+from flask import abort, request, Response, stream_with_context, \
+    json as flask_json
+from jsonschema import RefResolver
 import logging
+import json
+import zlib
+import yaml
+import os
 
 logger = logging.getLogger('label-api')
 
+# Validator for the records of an NDJSON objects stream, created on first use
+_image_objects_validator = None
+
 
 @flask_login.login_required
-def list_campaigns(page=1, per_page=10):
+def list_campaigns(page=1, per_page=10, include_total=None):
     """
     GET /campaigns
 
@@ -35,18 +49,19 @@ def list_campaigns(page=1, per_page=10):
         logger.warning("User not authorized")
         abort(401)
 
-    campaigns = Campaign.query.order_by(Campaign.id)\
-                              .paginate(page=page, per_page=per_page)
+    # The progress is stored on the campaign itself, so only the creators
+    # need to be loaded along with the campaigns
+    campaigns, pagination = paginate(
+        Campaign.query.options(db.joinedload(Campaign.created_by)),
+        Campaign.id,
+        page=page,
+        per_page=per_page,
+        include_total=include_total,
+        count_key=("campaigns",)
+    )
     return {
-        "pagination": {
-            "page": campaigns.page,
-            "pages": campaigns.page,
-            "total": campaigns.total,
-            "per_page": campaigns.per_page,
-            "prev": (campaigns.prev_num if campaigns.has_prev else None),
-            "next": (campaigns.next_num if campaigns.has_next else None)
-        },
-        "campaigns": [x.to_dict() for x in campaigns.items]
+        "pagination": pagination,
+        "campaigns": [x.to_dict() for x in campaigns]
     }
 
 
@@ -96,7 +111,8 @@ def change_status(campaign_id, body):
 
 
 @flask_login.login_required
-def get_objects(campaign_id, page=1, per_page=1000):
+def get_objects(campaign_id, page=1, per_page=1000, after_id=None,
+                cursor=None, limit=None, include_total=None):
     """
     GET /campaigns/{campaign_id}/objects
 
@@ -112,36 +128,94 @@ def get_objects(campaign_id, page=1, per_page=1000):
     if campaign is None:
         abort(404, "Campaign does not exist")
 
-    # Access to campaign images through query, to allow for pagination
-    c_images = CampaignImage.query\
-                            .filter(CampaignImage.campaign_id == campaign.id)\
-                            .order_by(CampaignImage.id)\
-                            .paginate(page=page, per_page=per_page)
+    # Access to campaign images through query, to allow for pagination. Only
+    # the columns needed are loaded, and the objects of the whole page are
+    # loaded in one query.
+    c_images, pagination = paginate(
+        db.session.query(CampaignImage.id, CampaignImage.image_id)
+                  .filter(CampaignImage.campaign_id == campaign.id),
+        CampaignImage.id,
+        page=page,
+        per_page=per_page,
+        after_id=after_id,
+        cursor=cursor,
+        limit=limit,
+        include_total=include_total,
+        count_key=("campaign_images", campaign.id)
+    )
+
+    objects = {x.id: [] for x in c_images}
+    if objects:
+        rows = db.session.query(*Object.row_columns())\
+                         .filter(Object.campaign_image_id.in_(list(objects)))\
+                         .order_by(Object.id)
+        for row in rows:
+            objects[row.campaign_image_id].append(row)
+
     return {
-        "pagination": {
-            "page": c_images.page,
-            "pages": c_images.page,
-            "total": c_images.total,
-            "per_page": c_images.per_page,
-            "prev": (c_images.prev_num if c_images.has_prev else None),
-            "next": (c_images.next_num if c_images.has_next else None)
-        },
+        "pagination": pagination,
         "images": [
             {
-                "image_id": x.image.id,
-                "url": x.image.get_api_url(),
+                "image_id": x.image_id,
+                "url": Image.api_url(x.image_id),
                 "objects": [
-                    y.to_dict()
-                    for y in sorted(x.objects, key=lambda y: y.id)
+                    Object.row_to_dict(y, x.image_id, campaign.id)
+                    for y in objects[x.id]
                 ]
             }
-            for x in c_images.items
+            for x in c_images
         ]
     }
 
 
 @flask_login.login_required
-def get_images(campaign_id, page=1, per_page=1000):
+def export_objects(campaign_id):
+    """
+    GET /campaigns/{campaign_id}/export
+
+    Stream all images in a campaign and the objects found in them, as gzip
+    compressed newline delimited JSON. The images and objects are read with
+    Campaign.export_rows, of which the rows are fetched in batches of
+    EXPORT_BATCH_SIZE, and compressed output is sent as soon as it is
+    available. Memory use therefore does not depend on the size of the
+    campaign.
+    """
+    # Check if logged in user has correct permissions.
+    if not flask_login.current_user.has_role("image-admin"):
+        logger.warning("User not authorized")
+        abort(401)
+
+    campaign = Campaign.query.get(campaign_id)
+    if campaign is None:
+        abort(404, "Campaign does not exist")
+
+    rows = Campaign.export_rows(campaign.id)
+
+    def generate():
+        compressor = zlib.compressobj(wbits=31)
+        for row, objects in Campaign.group_export_rows(rows):
+            data = compressor.compress(flask_json.dumps({
+                "image_id": row.image_id,
+                "url": Image.api_url(row.image_id),
+                "objects": [
+                    Object.row_to_dict(x, row.image_id, campaign.id)
+                    for x in objects
+                ]
+            }).encode() + b"\n")
+            if data:
+                yield data
+        yield compressor.flush()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Content-Encoding": "gzip"}
+    )
+
+
+@flask_login.login_required
+def get_images(campaign_id, page=1, per_page=1000, after_id=None,
+               cursor=None, limit=None, include_total=None):
     """
     GET /campaigns/{campaign_id}/images
 
@@ -164,25 +238,26 @@ def get_images(campaign_id, page=1, per_page=1000):
         abort(404, "Campaign does not exist")
 
     # Access to campaign images through query, to allow for pagination
-    c_images = CampaignImage.query\
-                            .filter(CampaignImage.campaign_id == campaign.id)\
-                            .order_by(CampaignImage.id)\
-                            .paginate(page=page, per_page=per_page)
+    c_images, pagination = paginate(
+        db.session.query(CampaignImage.id, CampaignImage.image_id)
+                  .filter(CampaignImage.campaign_id == campaign.id),
+        CampaignImage.id,
+        page=page,
+        per_page=per_page,
+        after_id=after_id,
+        cursor=cursor,
+        limit=limit,
+        include_total=include_total,
+        count_key=("campaign_images", campaign.id)
+    )
     return {
-        "pagination": {
-            "page": c_images.page,
-            "pages": c_images.page,
-            "total": c_images.total,
-            "per_page": c_images.per_page,
-            "prev": (c_images.prev_num if c_images.has_prev else None),
-            "next": (c_images.next_num if c_images.has_next else None)
-        },
+        "pagination": pagination,
         "images": [
             {
-                "image_id": x.image.id,
-                "url": x.image.get_api_url()
+                "image_id": x.image_id,
+                "url": Image.api_url(x.image_id)
             }
-            for x in c_images.items
+            for x in c_images
         ]
     }
 
@@ -274,6 +349,141 @@ def add_objects(campaign_id, body):
 
     success, sc, msg = campaign.add_objects(body)
     if success:
-        return "ok"
+        return msg
     else:
         abort(sc, msg)
+
+
+def get_image_objects_validator():
+    """
+    Get a validator for a single NewImageObjects record, based on the schema
+    in the API specification.
+    """
+    global _image_objects_validator
+    if _image_objects_validator is None:
+        path = os.path.join(os.path.dirname(__file__), "..", "api.yaml")
+        with open(path) as f:
+            spec = yaml.safe_load(f)
+        _image_objects_validator = Draft4RequestValidator(
+            {"$ref": "#/components/schemas/NewImageObjects"},
+            resolver=RefResolver("", spec, spec)
+        )
+    return _image_objects_validator
+
+
+@flask_login.login_required
+def add_objects_stream(campaign_id):
+    """
+    PUT /campaigns/{campaign_id}/objects/stream
+
+    Handle the delivery of new labeled objects for a campaign as a stream of
+    newline delimited JSON, with one NewImageObjects record per line. The
+    records are read, validated and applied in chunks, and every chunk is
+    committed on its own. Records that were committed can be skipped when
+    retrying a failed upload, through the "skip" query parameter.
+
+    This is registered as plain Flask route, as Connexion reads the full
+    request body before calling the handler.
+
+    Note: Can only add to active set
+    """
+    # Check if logged in user has correct permissions. Can be either
+    # image-admin or labeler on the specific campaign
+    if not (
+            flask_login.current_user.has_role("image-admin") or
+            flask_login.current_user.has_role_on_subject(
+                "labeler",
+                "campaign",
+                campaign_id)
+            ):
+        logger.warning("User not authorized")
+        abort(401)
+
+    if request.mimetype != "application/x-ndjson":
+        abort(415, "Content type must be application/x-ndjson")
+
+    chunk_size = request.args.get(
+        "chunk_size",
+        int(os.environ.get("OBJECTS_STREAM_CHUNK_SIZE", 1000)),
+        type=int
+    )
+    skip = request.args.get("skip", 0, type=int)
+    if chunk_size is None or chunk_size < 1 or skip is None or skip < 0:
+        abort(400, "chunk_size must be positive and skip can't be negative")
+
+    campaign = Campaign.query.get(campaign_id)
+    if campaign is None:
+        abort(404, "Campaign does not exist")
+
+    validator = get_image_objects_validator()
+    summary = {
+        "chunks": [],
+        "records": 0,
+        "updated": 0,
+        "skipped": 0,
+        "resume_from": None,
+        "error": None
+    }
+
+    def apply_chunk(start, chunk):
+        success, sc, msg = campaign.add_objects(chunk, check_completion=False)
+        if not success:
+            return sc, msg
+
+        summary["chunks"].append({
+            "first_record": start,
+            "last_record": start + len(chunk) - 1,
+            "records": len(chunk),
+            "updated": msg["updated"],
+            "skipped": msg["skipped"]
+        })
+        summary["records"] += len(chunk)
+        summary["updated"] += msg["updated"]
+        summary["skipped"] += msg["skipped"]
+        return None, None
+
+    # Read the records from the request stream, keeping only the current
+    # chunk in memory
+    sc, msg = None, None
+    chunk = []
+    start = skip
+    index = 0
+    for line in request.stream:
+        if not line.strip():
+            continue
+        if index < skip:
+            index += 1
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            sc, msg = 400, f"Record {index} is not valid JSON: {e}"
+            break
+        errors = [x.message for x in validator.iter_errors(record)]
+        if errors:
+            sc, msg = 400, f"Record {index} is invalid: {'; '.join(errors)}"
+            break
+
+        chunk.append(record)
+        index += 1
+        if len(chunk) == chunk_size:
+            sc, msg = apply_chunk(start, chunk)
+            if sc is not None:
+                break
+            start, chunk = index, []
+
+    if sc is None and chunk:
+        sc, msg = apply_chunk(start, chunk)
+
+    if sc is not None:
+        logger.warning(f"Objects stream for campaign {campaign_id} failed "
+                       f"at record {start}: {msg}")
+        summary["resume_from"] = start
+        summary["error"] = msg
+        return summary, sc
+
+    # All records are applied, check if the campaign is completed now
+    campaign.complete_if_labeled()
+
+    return summary
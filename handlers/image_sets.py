@@ -16,6 +16,7 @@
 
 from common.auth import flask_login
 from common.azure import AzureWrapper
+from common.pagination import paginate
 from models.image import ImageSet
 from flask import abort
 import logging
@@ -24,7 +25,7 @@ logger = logging.getLogger('label-api')
 
 
 @flask_login.login_required
-def list_imagesets(page=1, per_page=10):
+def list_imagesets(page=1, per_page=10, include_total=None):
     """
     GET /image_sets
 
@@ -35,19 +36,17 @@ def list_imagesets(page=1, per_page=10):
         logger.warning("User not authorized")
         abort(401)
 
-    imagesets = ImageSet.query\
-                        .order_by(ImageSet.id)\
-                        .paginate(page=page, per_page=per_page)
+    imagesets, pagination = paginate(
+        ImageSet.query,
+        ImageSet.id,
+        page=page,
+        per_page=per_page,
+        include_total=include_total,
+        count_key=("imagesets",)
+    )
     return {
-        "pagination": {
-            "page": imagesets.page,
-            "pages": imagesets.page,
-            "total": imagesets.total,
-            "per_page": imagesets.per_page,
-            "prev": (imagesets.prev_num if imagesets.has_prev else None),
-            "next": (imagesets.next_num if imagesets.has_next else None)
-        },
-        "image_sets": [x.to_dict() for x in imagesets.items]
+        "pagination": pagination,
+        "image_sets": [x.to_dict() for x in imagesets]
     }
 
 
@@ -107,7 +106,8 @@ def change_status(imageset_id, body):
 
 
 @flask_login.login_required
-def get_images(imageset_id, page=1, per_page=10):
+def get_images(imageset_id, page=1, per_page=10, after_id=None, cursor=None,
+               limit=None, include_total=None):
     """
     GET /image_sets/{imageset_id}/images
 
@@ -122,17 +122,12 @@ def get_images(imageset_id, page=1, per_page=10):
     if imageset is None:
         abort(404, "Image Set does not exist")
 
-    images = imageset.get_images_paginated(page, per_page)
+    images, pagination = imageset.get_images_paginated(
+        page, per_page, after_id=after_id, cursor=cursor, limit=limit,
+        include_total=include_total)
     return {
-        "pagination": {
-            "page": images.page,
-            "pages": images.page,
-            "total": images.total,
-            "per_page": images.per_page,
-            "prev": (images.prev_num if images.has_prev else None),
-            "next": (images.next_num if images.has_next else None)
-        },
-        "images": [x.to_dict() for x in images.items]
+        "pagination": pagination,
+        "images": [x.to_dict() for x in images]
     }
 
 
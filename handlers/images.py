@@ -15,16 +15,19 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from common.auth import flask_login
+from common.db import db
+from common.pagination import paginate
 from flask import abort, redirect
 from models.image import Image
-from models.campaign import Campaign
+from models.campaign import Campaign, CampaignImage
 import logging
 
 logger = logging.getLogger("label-api")
 
 
 @flask_login.login_required
-def list_images(page=1, per_page=10):
+def list_images(page=1, per_page=10, after_id=None, cursor=None,
+                limit=None, include_total=None):
     """
     GET /images
 
@@ -35,18 +38,20 @@ def list_images(page=1, per_page=10):
         logger.warning("User not authorized")
         abort(401)
 
-    images = Image.query.order_by(Image.id).paginate(page=page,
-                                                     per_page=per_page)
+    images, pagination = paginate(
+        Image.query,
+        Image.id,
+        page=page,
+        per_page=per_page,
+        after_id=after_id,
+        cursor=cursor,
+        limit=limit,
+        include_total=include_total,
+        count_key=("images",)
+    )
     return {
-        "pagination": {
-            "page": images.page,
-            "pages": images.page,
-            "total": images.total,
-            "per_page": images.per_page,
-            "prev": (images.prev_num if images.has_prev else None),
-            "next": (images.next_num if images.has_next else None)
-        },
-        "images": [x.to_dict() for x in images.items]
+        "pagination": pagination,
+        "images": [x.to_dict() for x in images]
     }
 
 
@@ -59,18 +64,26 @@ def get_image_url(image_id):
     blobstorage, with a SAS token for access.
 
     NOTE: This is implemented the "user-friendly" way. Alternatively, the
-          check if a user has access to the image
-          (current_user.has_access_to_image(image)) could return 404 as well,
+          check if a user has access to the image could return 404 as well,
           preventing a non-authorized user from knowing what images exist.
     """
-    # First get image object
-    image = Image.query.get(image_id)
-    if image is None:
+    # Get the image object, along with whether the user has access to it. For
+    # labelers, access is determined in the same query.
+    if flask_login.current_user.has_role("image-admin"):
+        access = db.true()
+    else:
+        access = CampaignImage.labeler_access(
+            flask_login.current_user, Image.id)
+
+    result = db.session.query(Image, access)\
+                       .filter(Image.id == image_id)\
+                       .one_or_none()
+    if result is None:
         abort(404, "Image does not exist")
+    image, has_access = result
 
     # Check permissions for the image
-    if not (flask_login.current_user.has_role("image-admin")
-            or flask_login.current_user.has_access_to_image(image)):
+    if not has_access:
         logger.warning("User not authorized")
         abort(401)
 
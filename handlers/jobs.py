@@ -0,0 +1,75 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from common.auth import flask_login
+from common.pagination import paginate
+from models.job import Job
+from flask import abort
+import logging
+
+logger = logging.getLogger("label-api")
+
+
+@flask_login.login_required
+def list_jobs(page=1, per_page=10, status=None, type=None,
+              include_total=None):
+    """
+    GET /jobs
+
+    List background jobs, most recent first
+    """
+    # Check if logged in user has correct permissions
+    if not flask_login.current_user.has_role("image-admin"):
+        logger.warning("User not authorized")
+        abort(401)
+
+    query = Job.query
+    if status is not None:
+        query = query.filter(Job.status == status)
+    if type is not None:
+        query = query.filter(Job.type == type)
+
+    jobs, pagination = paginate(
+        query,
+        Job.id,
+        page=page,
+        per_page=per_page,
+        include_total=include_total,
+        descending=True
+    )
+    return {
+        "pagination": pagination,
+        "jobs": [x.to_dict() for x in jobs]
+    }
+
+
+@flask_login.login_required
+def get_job(job_id):
+    """
+    GET /jobs/{job_id}
+
+    Get the status of a background job
+    """
+    # Check if logged in user has correct permissions
+    if not flask_login.current_user.has_role("image-admin"):
+        logger.warning("User not authorized")
+        abort(401)
+
+    job = Job.query.get(job_id)
+    if job is None:
+        abort(404, "Job does not exist")
+
+    return job.to_dict()
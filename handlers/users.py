@@ -0,0 +1,53 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from common.auth import flask_login
+from models.user import User
+from flask import abort
+import logging
+
+logger = logging.getLogger("label-api")
+
+
+@flask_login.login_required
+def add_users(body):
+    """
+    POST /users
+
+    Create users and their roles in bulk
+
+    Note: Existing users are reused, only missing roles are added to them. A
+    key is only generated for users that don't have one yet.
+    """
+    # Check if logged in user has correct permissions
+    if not flask_login.current_user.has_role("image-admin"):
+        logger.warning("User not authorized")
+        abort(401)
+
+    success, sc, response = User.provision(body)
+    if not success:
+        abort(sc, response)
+
+    return [
+        {
+            "email": x["email"],
+            "access_token": {
+                "apikey": x["apikey"],
+                "apisecret": x["apisecret"]
+            }
+        }
+        for x in response
+    ]
@@ -18,9 +18,10 @@ import connexion
 from flask_migrate import Migrate
 from flask import abort
 from prometheus_client import CollectorRegistry, generate_latest, multiprocess
-from models.campaign import Campaign, CampaignImage
+from models.campaign import Campaign, CampaignImage, CampaignExport
 from models.image import Image, ImageSet
 from models.object import Object
+from models.job import Job
 from models.user import User, Role
 from common.db import db, status_check as db_status_check, \
     version_check as db_version_check
@@ -29,6 +30,7 @@ from common.auth import login_manager
 from common.logger import create_logger
 from common.sentry import Sentry
 from common.prometheus import number_of_available_images
+import handlers.campaigns
 import os
 
 # Set up logging
@@ -57,7 +59,9 @@ class App:
         app.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
         app.app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
             "pool_recycle": 60,
-            "pool_size": 10
+            "pool_size": 10,
+            # Send bulk inserts as multi-row INSERT statements
+            "executemany_mode": "values"
         }
         db.init_app(app.app)
 
@@ -69,6 +73,14 @@ class App:
         app.add_api("api.yaml",
                     strict_validation=True)
 
+        # Not part of the API specification, as Connexion reads the complete
+        # request body before calling the handler
+        app.app.add_url_rule(
+            "/api/v1/campaigns/<int:campaign_id>/objects/stream",
+            view_func=handlers.campaigns.add_objects_stream,
+            methods=["PUT"]
+        )
+
         self.app = app.app  # Flask app object
         self.application = app  # Connexion app object
         self.db = db
@@ -0,0 +1,27 @@
+"""Unique index on user API key
+
+Revision ID: 2c8f4e1a9b37
+Revises: 413212592e9b
+Create Date: 2026-10-17 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c8f4e1a9b37'
+down_revision = '413212592e9b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Empty keys can never be used to log in, but would violate the unique
+    # constraint
+    op.execute('UPDATE "user" SET "API_KEY" = NULL WHERE "API_KEY" = \'\'')
+    op.create_index(op.f('ix_user_API_KEY'), 'user', ['API_KEY'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_API_KEY'), table_name='user')
@@ -0,0 +1,38 @@
+"""Campaign progress counters
+
+Revision ID: 9a4b6c2e8d15
+Revises: 5d1e7a3c0f62
+Create Date: 2026-10-17 11:24:09.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4b6c2e8d15'
+down_revision = '5d1e7a3c0f62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('campaign', sa.Column('image_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('campaign', sa.Column('labeled_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the counters of existing campaigns
+    op.execute(
+        'UPDATE campaign SET '
+        'image_count = ('
+        '    SELECT count(*) FROM campaign_image '
+        '    WHERE campaign_image.campaign_id = campaign.id), '
+        'labeled_count = ('
+        '    SELECT count(*) FROM campaign_image '
+        '    WHERE campaign_image.campaign_id = campaign.id '
+        '    AND campaign_image.labeled)'
+    )
+
+
+def downgrade():
+    op.drop_column('campaign', 'labeled_count')
+    op.drop_column('campaign', 'image_count')
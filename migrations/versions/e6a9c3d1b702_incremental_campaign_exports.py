@@ -0,0 +1,58 @@
+"""Incremental campaign exports
+
+Revision ID: e6a9c3d1b702
+Revises: d4f8b2c6e913
+Create Date: 2026-10-17 16:08:12.094518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a9c3d1b702'
+down_revision = 'd4f8b2c6e913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('campaign_image', sa.Column('objects_updated', sa.DateTime(), nullable=True))
+    op.create_table('campaign_export',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('campaign_id', sa.Integer(), nullable=False),
+    sa.Column('sequence', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.Enum('full', 'delta', name='campaign_export_kind'), nullable=False),
+    sa.Column('dataset', sa.String(length=256), nullable=False),
+    sa.Column('watermark', sa.DateTime(), nullable=True),
+    sa.Column('date_created', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['campaign_id'], ['campaign.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('campaign_id', 'sequence'),
+    sa.UniqueConstraint('id')
+    )
+
+    # Backfill when the objects of existing images last changed
+    op.execute(
+        'UPDATE campaign_image SET objects_updated = ('
+        '    SELECT max(object.date_added) FROM object '
+        '    WHERE object.campaign_image_id = campaign_image.id)'
+    )
+
+    # Campaigns that are finished already were fully exported
+    op.execute(
+        "INSERT INTO campaign_export "
+        "(campaign_id, sequence, kind, dataset, watermark) "
+        "SELECT campaign.id, 1, 'full', "
+        "    lower(replace(campaign.title, ' ', '-')) || '_labels', "
+        "    (SELECT max(campaign_image.objects_updated) "
+        "     FROM campaign_image "
+        "     WHERE campaign_image.campaign_id = campaign.id) "
+        "FROM campaign WHERE campaign.status = 'finished'"
+    )
+
+
+def downgrade():
+    op.drop_table('campaign_export')
+    op.execute('DROP TYPE campaign_export_kind')
+    op.drop_column('campaign_image', 'objects_updated')
@@ -16,14 +16,19 @@
 
 from common.db import db
 from common.azure import AzureWrapper
+from common.cache import count_cache
+from common.export import EXPORT_FORMATS
 from common.prometheus import number_of_labeled_images, number_of_bounding_boxes_per_image, number_of_unlabeled_images
 from sqlalchemy.dialects.postgresql import JSONB
+from datetime import datetime
 from models.user import User, Role
 from models.image import Image
 from models.object import Object
-from threading import Thread
-from flask import current_app
+from models.job import Job
+import hashlib
+import tempfile
 import logging
+import json
 import os
 
 logger = logging.getLogger("label-api")
@@ -50,6 +55,11 @@ class Campaign(db.Model):
     created_by_id = db.Column(
         db.Integer, db.ForeignKey(f"{os.environ['DB_SCHEMA']}.user.id"),
         name="created_by", nullable=False)
+    # Denormalized progress counters, maintained by add_images and add_objects
+    image_count = db.Column(db.Integer, nullable=False, default=0,
+                            server_default="0")
+    labeled_count = db.Column(db.Integer, nullable=False, default=0,
+                              server_default="0")
 
     created_by = db.relationship(
         "User",
@@ -70,8 +80,8 @@ class Campaign(db.Model):
             "title": self.title,
             "status": self.status,
             "progress": {
-                "done": len([x for x in self.campaign_images if x.labeled]),
-                "total": len(self.campaign_images)
+                "done": self.labeled_count,
+                "total": self.image_count
             },
             "metadata": self.meta_data,
             "label_translations": self.label_translations,
@@ -108,112 +118,209 @@ class Campaign(db.Model):
         """
         Add images to this campaign. Images could be provided by ID or by
         blobstorage path. Only allow adding images if current status of the
-        campaign is "created".
+        campaign is "created". Images that are already part of the campaign
+        are ignored.
 
         :params images:     List of images to add. Provided as objects, either
                             with "id" or as "filepath" as sole property.
         :returns boolean:   Success or not
-        :returns int:       Status code in case of failure - 404 if image does
-                            not exist or 409 if status of campaign != created
-        :returns string:    Error message in case of failure
+        :returns int:       Status code in case of failure - 404 if any image
+                            does not exist or 409 if status of campaign !=
+                            created
+        :returns string:    Error message in case of failure, listing all
+                            unknown images
         """
         if self.status != "created":
             logger.warning(f"Trying to add images to {self.status} campaign")
             return False, 409, \
                 f'Not allowed to add images while status is "{self.status}"'
 
+        # Resolve all images at once.
+        # NOTE: Connexion has already validated for us that either id or
+        #       filepath exists, hence the simple else statement
+        ids = set()
+        filepaths = set()
         for i in images:
-            # Find image.
-            # NOTE: Connexion has already validated for us that either id or
-            #       filepath exists, hence the simple else statement
             if "id" in i:
-                image = Image.query.get(i["id"])
+                ids.add(i["id"])
             else:
-                image = Image.query\
-                        .filter(Image.blobstorage_path == i["filepath"])\
-                        .first()
-
-            # Check if image exists
-            if image is None:
-                db.session.rollback()
-                return False, 404, "Unknown image provided"
-
-            # All good, add image to campaign, if not yet added (if it is,
-            # simply ignore). Note that this is not commited yet, allowing a
-            # rollback in case on of the other images can't be added
-            if image not in [x.image for x in self.campaign_images]:
-                campaign_image = CampaignImage(campaign_id=self.id,
-                                               image_id=image.id)
-                db.session.add(campaign_image)
+                filepaths.add(i["filepath"])
+
+        image_ids = set()
+        missing = []
+        if ids:
+            found = {
+                x for x, in db.session.query(Image.id)
+                                      .filter(Image.id.in_(ids))
+            }
+            image_ids |= found
+            missing += [str(x) for x in sorted(ids - found)]
+        if filepaths:
+            found = dict(
+                db.session.query(Image.blobstorage_path, Image.id)
+                          .filter(Image.blobstorage_path.in_(filepaths))
+            )
+            image_ids |= set(found.values())
+            missing += sorted(filepaths - found.keys())
+
+        # Check if all images exist
+        if missing:
+            logger.warning(f"Trying to add {len(missing)} unknown images")
+            return False, 404, \
+                f"Unknown images provided: {', '.join(missing)}"
+
+        # Skip images that are already part of the campaign
+        existing = {
+            x for x, in db.session.query(CampaignImage.image_id)
+                                  .filter(CampaignImage.campaign_id == self.id)
+                                  .filter(CampaignImage.image_id.in_(image_ids))
+        }
+        new_ids = sorted(image_ids - existing)
+
+        db.session.bulk_insert_mappings(CampaignImage, [
+            {"campaign_id": self.id, "image_id": x, "labeled": False}
+            for x in new_ids
+        ])
+
+        # Update the counter in SQL, so concurrent requests don't overwrite
+        # each other's increments
+        self.image_count = Campaign.image_count + len(new_ids)
 
         # Now that everything is done with no errors, we can commit.
         db.session.commit()
+        count_cache.delete(("campaign_images", self.id))
+
+        logger.info(f"Added {len(new_ids)} images to campaign {self.id}")
 
         # Update metrics
-        number_of_unlabeled_images.inc(len(images))
+        number_of_unlabeled_images.inc(len(new_ids))
 
         return True, None, None
 
-    def add_objects(self, objects):
+    def add_objects(self, objects, check_completion=True):
         """
         Add object to this campaign. Only allow adding images if current status
         of the campaign is "active". If at the end of this, an object is
         provided for each image, set status to complete.
 
         :params objects:    List of images and the objects in them to add.
+        :params check_completion:   Whether to set the status to complete when
+                            all images are labeled. When adding objects in
+                            several parts, disable this and call
+                            complete_if_labeled after the last part.
         :returns boolean:   Success or not
         :returns int:       Status code in case of failure - 404 if image does
                             not exist (in this campaign) or 409 if status of
                             campaign != active
-        :returns string:    Error message in case of failure
+        :returns:           Error message in case of failure, otherwise a
+                            dict with the number of "updated" images and the
+                            number of images "skipped" because their objects
+                            did not change
         """
         if self.status != "active":
             logger.warning(f"Trying to add objects to {self.status} campaign")
             return False, 409, \
                 f'Not allowed to add objects while status is "{self.status}"'
 
-        for item in objects:
-            # Find campaign image.
-            for x in self.campaign_images:
-                if x.image_id == item["image_id"]:
-                    campaign_image = x
-                    break
-            else:
-                # No object found, image not in campaign
-                db.session.rollback()
-                return False, 404, \
-                    f"Image {item['image_id']} does not exist or is " \
-                    "not part of this campaign"
-
-            # As per definition, we remove all existing labels on the
-            # current image
-            campaign_image.delete_objects(commit=False)
-
-            # Create label object and add to campaign image object. If a
-            # translated label is provided, use this as translated label.
-            # Otherwise, use the label for both.
-            for o in item["objects"]:
-                o = Object(
-                    campaign_image=campaign_image,
-                    label_translated=o.get("label_translated", o["label"]),
-                    label_original=o["label"],
-                    confidence=o.get("confidence"),
-                    x_min=o["bounding_box"]["xmin"],
-                    x_max=o["bounding_box"]["xmax"],
-                    y_min=o["bounding_box"]["ymin"],
-                    y_max=o["bounding_box"]["ymax"]
-                )
-                db.session.add(o)
+        # Index the campaign images the objects are provided for
+        image_ids = {x["image_id"] for x in objects}
+        campaign_images = {
+            x.image_id: x
+            for x in CampaignImage.query
+                                  .filter(CampaignImage.campaign_id == self.id)
+                                  .filter(CampaignImage.image_id.in_(image_ids))
+        }
+        missing = sorted(image_ids - campaign_images.keys())
+        if missing:
+            # Image not in campaign
+            return False, 404, \
+                f"Image {missing[0]} does not exist or is " \
+                "not part of this campaign"
+
+        # If an image is provided more than once, the last one is leading
+        latest = {x["image_id"]: x["objects"] for x in objects}
+
+        # Skip images for which exactly these objects are stored already
+        changed = []
+        for image_id, item_objects in latest.items():
+            campaign_image = campaign_images[image_id]
+            objects_hash = CampaignImage.hash_objects(item_objects)
+            if not campaign_image.labeled \
+                    or campaign_image.objects_hash != objects_hash:
+                changed.append((campaign_image, objects_hash, item_objects))
+        skipped = len(latest) - len(changed)
+
+        newly_labeled = 0
+        if changed:
+            ci_ids = [x[0].id for x in changed]
+
+            # As per definition, we remove all existing labels on the changed
+            # images
+            Object.query.filter(Object.campaign_image_id.in_(ci_ids))\
+                        .delete(synchronize_session=False)
+
+            # Create the label objects. If a translated label is provided, use
+            # this as translated label. Otherwise, use the label for both.
+            db.session.bulk_insert_mappings(Object, [
+                {
+                    "campaign_image_id": campaign_image.id,
+                    "label_translated": o.get("label_translated") or
+                    o["label"],
+                    "label_original": o["label"],
+                    "confidence": o.get("confidence"),
+                    "x_min": o["bounding_box"]["xmin"],
+                    "x_max": o["bounding_box"]["xmax"],
+                    "y_min": o["bounding_box"]["ymin"],
+                    "y_max": o["bounding_box"]["ymax"]
+                }
+                for campaign_image, _, item_objects in changed
+                for o in item_objects
+            ])
+
+            # Set status to labeled for these campaign images. The number of
+            # updated rows is the number of newly labeled images.
+            newly_labeled = CampaignImage.query\
+                .filter(CampaignImage.id.in_(ci_ids))\
+                .filter(CampaignImage.labeled.is_(False))\
+                .update({"labeled": True}, synchronize_session=False)
+
+            db.session.bulk_update_mappings(CampaignImage, [
+                {"id": campaign_image.id, "objects_hash": objects_hash}
+                for campaign_image, objects_hash, _ in changed
+            ])
+
+            # Register the change for the next delta export. This is the same
+            # time as the date_added of the new objects, but also covers
+            # images of which all objects were removed.
+            CampaignImage.query\
+                .filter(CampaignImage.id.in_(ci_ids))\
+                .update({"objects_updated": db.func.now()},
+                        synchronize_session=False)
+
+        # Update the counter in SQL and check for completion in the same
+        # transaction. The update locks the campaign row until the commit, so
+        # concurrent submissions are serialized here and exactly one of them
+        # sees the last image being labeled.
+        labeled_count, image_count, status = db.session.execute(
+            Campaign.__table__.update()
+            .where(Campaign.__table__.c.id == self.id)
+            .values(labeled_count=Campaign.__table__.c.labeled_count +
+                    newly_labeled)
+            .returning(Campaign.__table__.c.labeled_count,
+                       Campaign.__table__.c.image_count,
+                       Campaign.__table__.c.status)
+        ).first()
 
-            # Set status to labeled for this campaign image
-            campaign_image.labeled = True
+        # Check if all campaign_images are labeled
+        if check_completion and status == "active" \
+                and labeled_count >= image_count:
+            self.change_status("completed", commit=False)
 
         # Now that everything is done with no errors, we can commit.
         db.session.commit()
 
-        # Check if all campaign_images are labeled
-        if all([x.labeled for x in self.campaign_images]):
-            self.change_status("completed")
+        logger.info(f"Stored objects for {len(changed)} images in campaign "
+                    f"{self.id}, skipped {skipped} unchanged images")
 
         # Update the metrics
         number_of_labeled_images.inc(len(objects))
@@ -221,7 +328,31 @@ class Campaign(db.Model):
         for o in objects:
             number_of_bounding_boxes_per_image.observe(len(o['objects']))
 
-        return True, None, None
+        return True, None, {"updated": len(changed), "skipped": skipped}
+
+    def complete_if_labeled(self):
+        """
+        Set the status to completed if the campaign is active and all its
+        images are labeled. The campaign row is locked while checking, so this
+        is serialized with concurrent calls to add_objects.
+
+        :returns boolean:   Whether the campaign was completed
+        """
+        labeled_count, image_count, status = db.session.query(
+                Campaign.labeled_count,
+                Campaign.image_count,
+                Campaign.status
+            )\
+            .filter(Campaign.id == self.id)\
+            .with_for_update()\
+            .one()
+
+        if status == "active" and labeled_count >= image_count:
+            self.change_status("completed")
+            return True
+
+        db.session.commit()
+        return False
 
     allowed_status_transitions = {
         "created": ["active"],
@@ -230,12 +361,15 @@ class Campaign(db.Model):
         "finished": []
     }
 
-    def change_status(self, desired_status):
+    def change_status(self, desired_status, commit=True):
         """
         Change the status of the current set. Check if this is a valid
-        transition first.
+        transition first. When finishing, jobs are enqueued to run the
+        finishing actions and to write the exports.
 
         :param desired_status:  The status to go to
+        :param commit:          Whether to commit directly, or postpone this
+                                (when called as part of some other flow).
         :returns boolean:       Success or not
         """
         if desired_status not in self.allowed_status_transitions[self.status]:
@@ -255,21 +389,17 @@ class Campaign(db.Model):
             self.date_finished = None
         if desired_status == 'finished':
             self.date_finished = db.func.now()
-        db.session.commit()
-
-        # Handle finishing actions
-        if self.status == "finished":
-            t = Thread(
-                target=self.finish_campaign,
-                args=(
-                    current_app._get_current_object(),
-                    db,
-                    self.id,
-                    self.title
+            # Handle finishing actions in the background worker
+            Job.enqueue("finish_campaign", {"campaign_id": self.id},
+                        commit=False)
+            for export_format in Campaign.export_formats():
+                Job.enqueue(
+                    "export_campaign",
+                    {"campaign_id": self.id, "format": export_format},
+                    commit=False
                 )
-            )
-            t.daemon = True
-            t.start()
+        if commit:
+            db.session.commit()
 
         return True
 
@@ -279,66 +409,300 @@ class Campaign(db.Model):
         to Azure ML: The images as <campaign_title>_images and the labels as
         <campaign_title>_labels.
 
-        Is meant to be run as a thread, to allow the API to return.
+        When the campaign was exported before (it went back to active and
+        was finished again), only the labels of images whose objects changed
+        since the last export are exported, as
+        <campaign_title>_labels_delta_<sequence>. Every export is recorded as
+        CampaignExport, and listed in a manifest in the datastore.
+
+        Is meant to be run by the background worker, see worker.py.
 
         TODO: For future improvements, consider detecting the datastore based
               on the container component of the image path. For now this does
               not seem to be necessary, as we'll only use one container.
         """
-        logger.info("Started thread for finishing campaign")
-        paths = []
-        labels = []
+        logger.info("Started finishing campaign")
         campaign_title = campaign_title.lower().replace(" ", "-")
 
         with app.app_context():
-            campaign_images = CampaignImage.query.filter(
-                CampaignImage.campaign_id == campaign_id).all()
-            for campaign_image in campaign_images:
-                path = campaign_image.image.blobstorage_path
-                path = path.lstrip("/")
-                filepath = "/".join(path.split("/")[1:])
-
-                paths.append(filepath)
-
-                # Determine all objects and add to list.
-                labels.append({
-                    "image_url": filepath,
-                    "label": [
-                        {
-                            "label": x.label_translated,
-                            "bottomX": x.x_min,
-                            "topX": x.x_max,
-                            "bottomY": x.y_min,
-                            "topY": x.y_max
-                        }
-                        for x in campaign_image.objects
-                    ],
-                    "label_confidence": [
-                        x.confidence for x in campaign_image.objects
-                    ]
-                })
-
-            logger.info("Successfully parsed campaign image objects from DB")
-
-            AzureWrapper.export_images_to_ML(
-                campaign_title + "_images",
-                f"Exported dataset as result of the finishing of labeling " +
-                f"campaign {campaign_title}",
-                paths
-            )
-            logger.info(
-                f"Exported images to AzureML dataset {campaign_title}_images")
-
-            AzureWrapper.export_labels_to_ML(
-                campaign_title + "_labels",
-                f"Exported labels as result of the finishing of labeling " +
-                f"campaign {campaign_title}",
-                labels
+            previous = CampaignExport.query\
+                .filter(CampaignExport.campaign_id == campaign_id)\
+                .order_by(CampaignExport.sequence.desc())\
+                .first()
+            watermark = db.session.query(
+                    db.func.max(CampaignImage.objects_updated))\
+                .filter(CampaignImage.campaign_id == campaign_id)\
+                .scalar()
+
+            if previous is None:
+                export = CampaignExport(
+                    campaign_id=campaign_id,
+                    sequence=1,
+                    kind="full",
+                    dataset=campaign_title + "_labels",
+                    watermark=watermark
+                )
+                Campaign._export_full(campaign_id, campaign_title)
+            else:
+                # This also skips a retry of a job of which the export was
+                # recorded already
+                if watermark is None or (previous.watermark is not None and
+                                         watermark <= previous.watermark):
+                    logger.info("No objects changed since the last export")
+                    logger.info("Finishing campaign done")
+                    return True
+
+                export = CampaignExport(
+                    campaign_id=campaign_id,
+                    sequence=previous.sequence + 1,
+                    kind="delta",
+                    dataset=f"{campaign_title}_labels_delta_"
+                            f"{previous.sequence + 1}",
+                    watermark=watermark
+                )
+                AzureWrapper.export_labels_to_ML(
+                    export.dataset,
+                    f"Exported changed labels as result of the finishing of "
+                    f"labeling campaign {campaign_title}",
+                    Campaign.iter_labels(
+                        campaign_id,
+                        updated_after=previous.watermark or datetime.min)
+                )
+                logger.info(
+                    f"Exported changed labels to AzureML dataset "
+                    f"{export.dataset}")
+
+            # Upload the manifest before committing the export, so an export
+            # is never recorded without being part of the manifest
+            db.session.add(export)
+            db.session.flush()
+            CampaignExport.upload_manifest(campaign_id, campaign_title)
+            db.session.commit()
+
+            logger.info("Finishing campaign done")
+            return True
+
+    @staticmethod
+    def _export_full(campaign_id, campaign_title):
+        """
+        Export all images and labels of a campaign to Azure ML, as
+        <campaign_title>_images and <campaign_title>_labels.
+        """
+        paths = [
+            Campaign.datastore_path(x)
+            for x, in db.session.query(Image.blobstorage_path)
+                        .join(CampaignImage,
+                              CampaignImage.image_id == Image.id)
+                        .filter(CampaignImage.campaign_id == campaign_id)
+                        .order_by(CampaignImage.id)
+                        .yield_per(Campaign.export_batch_size())
+        ]
+        labels = Campaign.iter_labels(campaign_id)
+
+        AzureWrapper.export_images_to_ML(
+            campaign_title + "_images",
+            f"Exported dataset as result of the finishing of labeling " +
+            f"campaign {campaign_title}",
+            paths
+        )
+        logger.info(
+            f"Exported images to AzureML dataset {campaign_title}_images")
+
+        AzureWrapper.export_labels_to_ML(
+            campaign_title + "_labels",
+            f"Exported labels as result of the finishing of labeling " +
+            f"campaign {campaign_title}",
+            labels
+        )
+        logger.info(
+            f"Exported labels to AzureML dataset {campaign_title}_labels")
+
+    def export(self, export_format):
+        """
+        Write the campaign in one of the formats of common.export, and upload
+        it to the Azure ML datastore as
+        exports/<campaign_title>/<file name of the format>.
+
+        Is meant to be run by the background worker, see worker.py.
+
+        :param export_format:   Key of common.export.EXPORT_FORMATS
+        """
+        filename, writer = EXPORT_FORMATS[export_format]
+        campaign_title = self.title.lower().replace(" ", "-")
+        target_path = f"exports/{campaign_title}"
+
+        logger.info(f"Started {export_format} export of campaign "
+                    f"{campaign_title}")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = os.path.join(tmp_dir, filename)
+            writer(
+                local_path,
+                Campaign.iter_objects(self.id),
+                f"Objects of labeling campaign {campaign_title}"
             )
-            logger.info(
-                f"Exported labels to AzureML dataset {campaign_title}_labels")
+            AzureWrapper.upload_to_datastore(
+                [local_path], tmp_dir, target_path)
 
-            logger.info("Thread for finishing campaign set done")
+        logger.info(f"Exported campaign to {target_path}/{filename}")
+        return True
+
+    @staticmethod
+    def export_formats():
+        """
+        The formats to export campaigns in when they are finished, from the
+        comma separated EXPORT_FORMATS setting. Unknown formats are logged and
+        skipped, so no export jobs are enqueued for them.
+        """
+        formats = os.environ.get("EXPORT_FORMATS", "coco,parquet")
+        result = []
+        for name in formats.split(","):
+            name = name.strip()
+            if not name:
+                continue
+            if name not in EXPORT_FORMATS:
+                logger.warning(f"Unknown export format {name}, skipping")
+                continue
+            result.append(name)
+        return result
+
+    @staticmethod
+    def export_batch_size():
+        return int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+    @staticmethod
+    def datastore_path(path):
+        """
+        Get the path of an image relative to the Azure ML datastore, by
+        removing the container from the blobstorage path.
+        """
+        path = path.lstrip("/")
+        return "/".join(path.split("/")[1:])
+
+    @staticmethod
+    def export_rows(campaign_id, updated_after=None):
+        """
+        Query the images of a campaign along with their objects, for exports.
+        There is one row per object, and a single row without object for
+        images without objects. The object columns are those of
+        Object.row_columns, so rows can be serialized with Object.row_to_dict.
+        Rows are ordered by campaign image, and fetched from the database in
+        batches of EXPORT_BATCH_SIZE, so memory use does not depend on the
+        size of the campaign.
+
+        :param campaign_id:     ID of the campaign
+        :param updated_after:   Optional date, to only include images whose
+                                objects changed after it
+        :returns:               Query of rows
+        """
+        query = db.session.query(
+                CampaignImage.id.label("campaign_image"),
+                Image.id.label("image_id"),
+                Image.blobstorage_path,
+                Image.width,
+                Image.height,
+                Object.id,
+                Object.label_translated,
+                Object.label_original,
+                Object.x_min,
+                Object.x_max,
+                Object.y_min,
+                Object.y_max,
+                Object.confidence,
+                Object.date_added
+            )\
+            .join(Image, CampaignImage.image_id == Image.id)\
+            .outerjoin(Object, Object.campaign_image_id == CampaignImage.id)\
+            .filter(CampaignImage.campaign_id == campaign_id)
+        if updated_after is not None:
+            query = query.filter(
+                CampaignImage.objects_updated > updated_after)
+
+        return query.order_by(CampaignImage.id, Object.id)\
+                    .yield_per(Campaign.export_batch_size())
+
+    @staticmethod
+    def group_export_rows(rows):
+        """
+        Group the rows of Campaign.export_rows per campaign image.
+
+        :param rows:    Rows as returned by Campaign.export_rows
+        :returns:       Generator of (row, objects) tuples, one per image,
+                        where row is the first row of the image and objects
+                        the rows of its objects
+        """
+        # Rows are ordered by campaign image, so an image is complete as soon
+        # as a row of the next image comes in
+        first = None
+        objects = []
+        for row in rows:
+            if first is None or row.campaign_image != first.campaign_image:
+                if first is not None:
+                    yield first, objects
+                first = row
+                objects = []
+
+            # Images without objects have a single row without an object
+            if row.id is not None:
+                objects.append(row)
+
+        if first is not None:
+            yield first, objects
+
+    @staticmethod
+    def iter_objects(campaign_id):
+        """
+        Generate the objects of all images in a campaign, in the format of the
+        writers in common.export.
+
+        :param campaign_id:     ID of the campaign
+        :returns:               Generator of dicts, one per object
+        """
+        for row in Campaign.export_rows(campaign_id):
+            yield {
+                "image_id": row.image_id,
+                "image_url": Campaign.datastore_path(row.blobstorage_path),
+                "width": row.width,
+                "height": row.height,
+                "object_id": row.id,
+                "label": row.label_translated,
+                "label_original": row.label_original,
+                "confidence": row.confidence,
+                "x_min": row.x_min,
+                "x_max": row.x_max,
+                "y_min": row.y_min,
+                "y_max": row.y_max
+            }
+
+    @staticmethod
+    def iter_labels(campaign_id, updated_after=None):
+        """
+        Generate the labels of all images in a campaign, in the format of
+        AzureWrapper.export_labels_to_ML. The images and their objects are
+        read with a single streamed query, see Campaign.export_rows.
+
+        :param campaign_id:     ID of the campaign
+        :param updated_after:   Optional date, to only include images whose
+                                objects changed after it
+        :returns:               Generator of dicts with "image_url", "label"
+                                and "label_confidence", one per image
+        """
+        rows = Campaign.export_rows(campaign_id, updated_after=updated_after)
+        for row, objects in Campaign.group_export_rows(rows):
+            yield {
+                "image_url": Campaign.datastore_path(row.blobstorage_path),
+                "label": [
+                    {
+                        "label": x.label_translated,
+                        "bottomX": x.x_min,
+                        "topX": x.x_max,
+                        "bottomY": x.y_min,
+                        "topY": x.y_max
+                    }
+                    for x in objects
+                ],
+                "label_confidence": [x.confidence for x in objects]
+            }
 
     @staticmethod
     def create(labeler_email, title, created_by, metadata=None,
@@ -375,6 +739,7 @@ class Campaign(db.Model):
         )
         db.session.add(campaign)
         db.session.commit()
+        count_cache.delete(("campaigns",))
 
         # Add role to user that gives access to the campaign
         campaign.give_labeler_access(user, commit=True)
@@ -387,17 +752,99 @@ class Campaign(db.Model):
         return response
 
 
+class CampaignExport(db.Model):
+    """
+    Export of a finished campaign to Azure ML. The first export of a campaign
+    is a full export, later exports (after the campaign was finished again)
+    are deltas containing only the images whose objects changed after the
+    watermark of the previous export.
+    """
+    __tablename__ = "campaign_export"
+    __table_args__ = (
+        db.UniqueConstraint("campaign_id", "sequence"),
+        {"schema": os.environ["DB_SCHEMA"]}
+    )
+    id = db.Column(db.Integer, primary_key=True, unique=True)
+    campaign_id = db.Column(
+        db.Integer, db.ForeignKey(f"{os.environ['DB_SCHEMA']}.campaign.id"),
+        nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)
+    kind = db.Column(
+        db.Enum("full", "delta", name="campaign_export_kind"),
+        nullable=False
+    )
+    dataset = db.Column(db.String(256), nullable=False)
+    # Latest CampaignImage.objects_updated included in this export, or None
+    # if no objects were submitted at all
+    watermark = db.Column(db.DateTime, nullable=True)
+    date_created = db.Column(db.DateTime, nullable=False,
+                             server_default=db.func.now())
+
+    def __repr__(self):
+        return "<CampaignExport %r-%r>" % (self.campaign_id, self.sequence)
+
+    def to_dict(self):
+        return {
+            "sequence": self.sequence,
+            "kind": self.kind,
+            "dataset": self.dataset,
+            "file": f"label_sets/{self.dataset}.csv",
+            "watermark": self.watermark.isoformat()
+            if self.watermark is not None else None,
+            "date_created": self.date_created.isoformat()
+            if self.date_created is not None else None
+        }
+
+    @staticmethod
+    def upload_manifest(campaign_id, campaign_title):
+        """
+        Upload the manifest of all exports of a campaign to the Azure ML
+        datastore, as label_sets/<campaign_title>_manifest.json. To get the
+        current labels, consumers take the full export and apply the deltas
+        in order of sequence, where the labels of an image in a delta replace
+        the labels of that image.
+
+        :param campaign_id:     ID of the campaign
+        :param campaign_title:  Title of the campaign, as used in the dataset
+                                names
+        """
+        exports = CampaignExport.query\
+            .filter(CampaignExport.campaign_id == campaign_id)\
+            .order_by(CampaignExport.sequence)\
+            .all()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = os.path.join(
+                tmp_dir, f"{campaign_title}_manifest.json")
+            with open(local_path, "w") as f:
+                json.dump({
+                    "campaign_id": campaign_id,
+                    "campaign": campaign_title,
+                    "exports": [x.to_dict() for x in exports]
+                }, f, indent=2)
+            AzureWrapper.upload_to_datastore(
+                [local_path], tmp_dir, "label_sets")
+
+
 class CampaignImage(db.Model):
     __tablename__ = "campaign_image"
-    __table_args__ = {"schema": os.environ["DB_SCHEMA"]}
+    __table_args__ = (
+        # Supports keyset pagination over the images of a campaign
+        db.Index("ix_campaign_image_campaign_id_id", "campaign_id", "id"),
+        {"schema": os.environ["DB_SCHEMA"]}
+    )
     id = db.Column(db.Integer, primary_key=True, unique=True)
     campaign_id = db.Column(
         db.Integer, db.ForeignKey(f"{os.environ['DB_SCHEMA']}.campaign.id"),
         nullable=False)
     image_id = db.Column(
         db.Integer, db.ForeignKey(f"{os.environ['DB_SCHEMA']}.image.id"),
-        nullable=False)
+        nullable=False, index=True)
     labeled = db.Column(db.Boolean, nullable=False, default=False)
+    # Hash of the objects as last submitted, see CampaignImage.hash_objects
+    objects_hash = db.Column(db.String(64), nullable=True)
+    # When the objects were last changed, see CampaignExport
+    objects_updated = db.Column(db.DateTime, nullable=True)
 
     campaign = db.relationship(
         "Campaign",
@@ -425,12 +872,45 @@ class CampaignImage(db.Model):
             "labeled": self.labeled
         }
 
-    def delete_objects(self, commit=True):
+    @staticmethod
+    def hash_objects(objects):
         """
-        Delete all attached objects.
+        Hash a list of submitted objects (in the NewObject format), to detect
+        resubmissions of the same objects. The order of the objects does not
+        influence the hash.
+
+        :param objects:     The submitted objects
+        :returns:           Hex digest of the objects
         """
-        for o in self.objects:
-            db.session.delete(o)
+        normalized = sorted(
+            json.dumps([
+                o["label"],
+                o.get("label_translated") or o["label"],
+                o.get("confidence"),
+                o["bounding_box"]["xmin"],
+                o["bounding_box"]["xmax"],
+                o["bounding_box"]["ymin"],
+                o["bounding_box"]["ymax"]
+            ])
+            for o in objects
+        )
+        return hashlib.sha256("\n".join(normalized).encode()).hexdigest()
 
-        if commit:
-            db.session.commit()
+    @staticmethod
+    def labeler_access(user, image_id):
+        """
+        Create an SQL expression that checks if a user has the labeler role on
+        any of the campaigns an image is part of.
+
+        :param user:        The user to check access for
+        :param image_id:    ID of the image, or a column expression to
+                            correlate with (eg Image.id)
+        :returns:           EXISTS expression
+        """
+        return db.exists().where(db.and_(
+            CampaignImage.image_id == image_id,
+            Role.user_id == user.id,
+            Role.role == "labeler",
+            Role.subject_type == "campaign",
+            Role.subject_id == CampaignImage.campaign_id
+        ))
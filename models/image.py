@@ -15,6 +15,8 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from common.db import db
+from common.pagination import paginate
+from common.cache import count_cache, sas_url_cache, sas_url_ttl
 from common.prometheus import number_of_available_images, total_storage_container_size
 from sqlalchemy.dialects.postgresql import JSONB
 from geoalchemy2 import Geometry
@@ -22,8 +24,7 @@ from common.azure import AzureWrapper
 from datetime import datetime, timedelta
 import os
 import logging
-from flask import current_app
-from threading import Thread
+from models.job import Job
 
 
 logger = logging.getLogger("label-api")
@@ -31,7 +32,11 @@ logger = logging.getLogger("label-api")
 
 class Image(db.Model):
     __tablename__ = "image"
-    __table_args__ = {"schema": os.environ["DB_SCHEMA"]}
+    __table_args__ = (
+        # Supports keyset pagination over the images of an image set
+        db.Index("ix_image_imageset_id_id", "imageset_id", "id"),
+        {"schema": os.environ["DB_SCHEMA"]}
+    )
     id = db.Column(db.Integer, primary_key=True, unique=True)
     blobstorage_path = db.Column(db.String(1024), nullable=False, unique=True)
     imageset_id = db.Column(
@@ -101,19 +106,36 @@ class Image(db.Model):
         """
         Return the (relative) url that points towards the redirected download.
         """
-        return f"/images/{self.id}"
+        return Image.api_url(self.id)
+
+    @staticmethod
+    def api_url(image_id):
+        """
+        Return the (relative) url that points towards the redirected download,
+        for when only the ID of the image is loaded.
+        """
+        return f"/images/{image_id}"
 
     def get_azure_url(self):
         """
         Return the Azure direct download URI, including a SAS token for access.
+        The URL is cached and reused until SAS_URL_CACHE_REFRESH_FRACTION of
+        the validity of the token has passed, so repeated views of an image
+        get the same URL and can be served from the HTTP cache of the client.
         """
-        return AzureWrapper.get_sas_url(
+        key = (self.blobstorage_path, "read")
+        url = sas_url_cache.get(key)
+        if url is not None:
+            return url
+
+        valid_days = int(os.environ.get("IMAGE_READ_TOKEN_VALID_DAYS", 7))
+        url = AzureWrapper.get_sas_url(
             self.blobstorage_path,
-            expires=datetime.utcnow() + timedelta(
-                days=int(os.environ.get("IMAGE_READ_TOKEN_VALID_DAYS", 7))
-            ),
+            expires=datetime.utcnow() + timedelta(days=valid_days),
             permissions=["read"]
         )
+        sas_url_cache.set(key, url, ttl=sas_url_ttl())
+        return url
 
     def get_objects(self, campaigns=[]):
         """
@@ -199,11 +221,25 @@ class ImageSet(db.Model):
             "created_by": self.created_by.email
         }
 
-    def get_images_paginated(self, page=1, per_page=10):
-        return Image.query\
-            .filter(Image.imageset == self)\
-            .order_by(Image.id)\
-            .paginate(page=page, per_page=per_page)
+    def get_images_paginated(self, page=1, per_page=10, after_id=None,
+                             cursor=None, limit=None, include_total=None):
+        """
+        Get a page of the images in this set, see common.pagination.paginate.
+
+        :returns:   Tuple containing the list of images and a dict with
+                    pagination data.
+        """
+        return paginate(
+            Image.query.filter(Image.imageset_id == self.id),
+            Image.id,
+            page=page,
+            per_page=per_page,
+            after_id=after_id,
+            cursor=cursor,
+            limit=limit,
+            include_total=include_total,
+            count_key=("imageset_images", self.id)
+        )
 
     allowed_status_transitions = {
         "created": ["finished"],
@@ -227,17 +263,10 @@ class ImageSet(db.Model):
         self.status = desired_status
         if desired_status == 'finished':
             self.date_finished = db.func.now()
+            # Handle finishing actions in the background worker
+            Job.enqueue("finish_set", {"imageset_id": self.id}, commit=False)
         db.session.commit()
 
-        # Handle finishing actions
-        if self.status == "finished":
-            t = Thread(
-                target=self.finish_set,
-                args=(current_app._get_current_object(), db, self.id)
-            )
-            t.daemon = True
-            t.start()
-
         return True
 
     def finish_set(self, app, db, imgset_id):
@@ -248,8 +277,8 @@ class ImageSet(db.Model):
         - Set the path of the image set to the new storage location
         - Remove the temporary dropbox
 
-        Is meant to be run as a thread, hence the explicit passing of the app
-        and DB objects.
+        Is meant to be run by the background worker (see worker.py), hence the
+        explicit passing of the app and DB objects.
 
         Requires the following environment variables to be set:
         AZURE_STORAGE_IMAGESET_CONTAINER
@@ -258,8 +287,9 @@ class ImageSet(db.Model):
         :param app:         The app object this is run as (use
                             flask.current_app._get_current_object())
         :param db:          The database object
+        :returns:           Boolean indicating success
         """
-        logger.info("Started thread for finishing image set")
+        logger.info("Started finishing image set")
 
         with app.app_context():
             # Load the object again, to prevent any DB/threading issues
@@ -270,6 +300,12 @@ class ImageSet(db.Model):
                 imgset.title.lower().replace(" ", "-")
 
             dropbox = imgset.blobstorage_path
+            if dropbox == f"{target_container}/{folder_name}":
+                # A previous attempt stored the images already, but did not
+                # finish. The dropbox is no longer known at this point.
+                logger.warning("Images of the set were moved already, "
+                               "skipping finishing actions")
+                return True
 
             # Copy all files from dropbox to final folder
             files = AzureWrapper.copy_contents(
@@ -284,7 +320,7 @@ class ImageSet(db.Model):
                 logger.warning(
                     "Failed to copy images from dropbox to uploads folder, "
                     "possibly partially")
-                return
+                return False
 
             logger.debug("Files copied")
 
@@ -310,6 +346,9 @@ class ImageSet(db.Model):
             # Change blobstorage path
             imgset.blobstorage_path = f"{target_container}/{folder_name}"
 
+            # This runs in the worker, so there is no point in deleting the
+            # counts from count_cache; the totals of the API processes pick
+            # up the new images once COUNT_CACHE_TTL_SECONDS passed
             db.session.commit()
 
         logger.debug("Image objects created")
@@ -322,7 +361,8 @@ class ImageSet(db.Model):
         # Delete dropbox
         AzureWrapper.delete_container(dropbox)
 
-        logger.info("Thread for finishing image set done")
+        logger.info("Finishing image set done")
+        return True
 
     def add_images(self, images):
         """
@@ -373,6 +413,7 @@ class ImageSet(db.Model):
 
         # Now that everything is done with no errors, we can commit.
         db.session.commit()
+        count_cache.delete(("imageset_images", self.id))
         return True, None, None
 
     @staticmethod
@@ -409,6 +450,7 @@ class ImageSet(db.Model):
         )
         db.session.add(imageset)
         db.session.commit()
+        count_cache.delete(("imagesets",))
 
         response = imageset.to_dict()
         response["dropbox_url"] = AzureWrapper.get_container_sas_url(
@@ -0,0 +1,198 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from common.db import db
+from sqlalchemy.dialects.postgresql import JSONB
+from datetime import timedelta
+import logging
+import os
+
+logger = logging.getLogger("label-api")
+
+
+class Job(db.Model):
+    """
+    Background job, executed by the worker process (see worker.py). Jobs are
+    claimed with SELECT ... FOR UPDATE SKIP LOCKED, so multiple workers can
+    run next to each other. A claimed job is leased to the worker for a
+    limited time: if the worker dies, the job is retried once the lease
+    expires.
+    """
+    __tablename__ = "job"
+    __table_args__ = (
+        db.Index("ix_job_status_run_after", "status", "run_after"),
+        {"schema": os.environ["DB_SCHEMA"]}
+    )
+    id = db.Column(db.Integer, primary_key=True, unique=True)
+    type = db.Column(db.String(64), nullable=False)
+    payload = db.Column(JSONB, nullable=False)
+    status = db.Column(
+        db.Enum("queued", "running", "done", "failed", name="job_status"),
+        nullable=False,
+        default="queued"
+    )
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    run_after = db.Column(db.DateTime, nullable=False,
+                          server_default=db.func.now())
+    locked_until = db.Column(db.DateTime, nullable=True)
+    date_created = db.Column(db.DateTime, nullable=False,
+                             server_default=db.func.now())
+    date_finished = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return "<Job %r %r>" % (self.type, self.id)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "type": self.type,
+            "payload": self.payload,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "last_error": self.last_error,
+            "run_after": self.run_after,
+            "date_created": self.date_created,
+            "date_finished": self.date_finished
+        }
+
+    @staticmethod
+    def enqueue(type, payload, commit=True):
+        """
+        Add a job to the queue.
+
+        :param type:        Type of the job, see worker.HANDLERS
+        :param payload:     JSON-serializable dict passed to the handler
+        :param commit:      Whether to commit directly, or postpone this (when
+                            called as part of some other flow). Enqueueing
+                            in the same transaction as the change that
+                            requires the job guarantees the job is only run
+                            if the change is committed.
+        :returns:           The job
+        """
+        job = Job(
+            type=type,
+            payload=payload,
+            max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+        )
+        db.session.add(job)
+        if commit:
+            db.session.commit()
+
+        logger.info(f"Enqueued {type} job")
+        return job
+
+    @staticmethod
+    def claim():
+        """
+        Claim the next job that is due. The job is set to running and leased
+        to the current worker for JOB_LEASE_SECONDS. The worker renews the
+        lease while the job runs, see Job.renew_lease.
+
+        A job whose lease has expired was abandoned by a worker that died
+        while running it. Such a job is registered as a failed attempt (see
+        Job.fail), so it is retried with backoff, or marked as failed when it
+        has been attempted max_attempts times.
+
+        :returns:   The job, or None if no job is due
+        """
+        now = db.func.now()
+        while True:
+            job = Job.query\
+                .filter(db.or_(
+                    db.and_(Job.status == "queued", Job.run_after <= now),
+                    db.and_(Job.status == "running", Job.locked_until < now)
+                ))\
+                .order_by(Job.run_after, Job.id)\
+                .with_for_update(skip_locked=True)\
+                .first()
+
+            if job is None:
+                db.session.commit()
+                return None
+            if job.status == "queued":
+                break
+            job.fail("Lease expired")
+
+        job.status = "running"
+        job.attempts += 1
+        job.locked_until = now + timedelta(seconds=Job.lease_seconds())
+        db.session.commit()
+
+        logger.info(f"Claimed {job.type} job {job.id}, attempt "
+                    f"{job.attempts} of {job.max_attempts}")
+        return job
+
+    @staticmethod
+    def lease_seconds():
+        return int(os.environ.get("JOB_LEASE_SECONDS", 3600))
+
+    @staticmethod
+    def renew_lease(job_id, engine):
+        """
+        Extend the lease of a running job by JOB_LEASE_SECONDS. This is
+        called from a heartbeat thread of the worker, so it uses a connection
+        of its own instead of the session the job runs in.
+
+        :param job_id:  ID of the job
+        :param engine:  The database engine (db.engine)
+        """
+        table = Job.__table__
+        engine.execute(
+            table.update()
+            .where(table.c.id == job_id)
+            .where(table.c.status == "running")
+            .values(locked_until=db.func.now() +
+                    timedelta(seconds=Job.lease_seconds()))
+        )
+
+    def complete(self):
+        """
+        Mark the job as done.
+        """
+        self.status = "done"
+        self.locked_until = None
+        self.date_finished = db.func.now()
+        db.session.commit()
+
+        logger.info(f"Finished {self.type} job {self.id}")
+
+    def fail(self, error):
+        """
+        Register a failed attempt. The job is retried with exponential backoff
+        (JOB_RETRY_BACKOFF_SECONDS, doubled for every attempt), until it has
+        been attempted max_attempts times.
+
+        :param error:   Description of the error
+        """
+        now = db.func.now()
+        self.last_error = error
+        self.locked_until = None
+        if self.attempts >= self.max_attempts:
+            self.status = "failed"
+            self.date_finished = now
+            logger.error(f"{self.type} job {self.id} failed permanently: "
+                         f"{error}")
+        else:
+            backoff = int(os.environ.get("JOB_RETRY_BACKOFF_SECONDS", 60)) \
+                * 2 ** (self.attempts - 1)
+            self.status = "queued"
+            self.run_after = now + timedelta(seconds=backoff)
+            logger.warning(f"{self.type} job {self.id} failed, retrying in "
+                           f"{backoff} seconds: {error}")
+        db.session.commit()
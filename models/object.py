@@ -47,17 +47,51 @@ class Object(db.Model):
             (self.label_translated, self.campaign_image.image)
 
     def to_dict(self):
+        return Object.row_to_dict(
+            self,
+            self.campaign_image.image_id,
+            self.campaign_image.campaign_id
+        )
+
+    @staticmethod
+    def row_columns():
+        """
+        The columns needed by Object.row_to_dict, to query rows instead of
+        full ORM objects.
+        """
+        return (
+            Object.id,
+            Object.campaign_image_id,
+            Object.label_translated,
+            Object.x_min,
+            Object.x_max,
+            Object.y_min,
+            Object.y_max,
+            Object.confidence,
+            Object.date_added
+        )
+
+    @staticmethod
+    def row_to_dict(row, image_id, campaign_id):
+        """
+        Serialize an object, from either an Object or a row containing the
+        columns of Object.row_columns.
+
+        :param row:         The object or row to serialize
+        :param image_id:    ID of the image the object is found in
+        :param campaign_id: ID of the campaign the object belongs to
+        """
         return {
-            "object_id": self.id,
-            "image_id": self.campaign_image.image.id,
-            "campaign_id": self.campaign_image.campaign.id,
-            "label": self.label_translated,
+            "object_id": row.id,
+            "image_id": image_id,
+            "campaign_id": campaign_id,
+            "label": row.label_translated,
             "bounding_box": {
-                "xmin": self.x_min,
-                "xmax": self.x_max,
-                "ymin": self.y_min,
-                "ymax": self.y_max
+                "xmin": row.x_min,
+                "xmax": row.x_max,
+                "ymin": row.y_min,
+                "ymax": row.y_max
             },
-            "confidence": self.confidence,
-            "date_added": self.date_added
+            "confidence": row.confidence,
+            "date_added": row.date_added
         }
@@ -15,8 +15,11 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from common.db import db
+from common.cache import credential_cache
+from sqlalchemy import event
 from sqlalchemy.dialects.postgresql import BYTEA
 from sqlalchemy.orm import validates
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
 import flask_login
 import secrets
@@ -26,13 +29,21 @@ import os
 logger = logging.getLogger("label-api")
 
 
+def hash_secret(api_secret):
+    """
+    Hash an API secret. Defined on module level, so it can be used in a
+    process pool.
+    """
+    return bcrypt.hashpw(api_secret.encode(), bcrypt.gensalt())
+
+
 class User(db.Model, flask_login.UserMixin):
     __tablename__ = "user"
     __table_args__ = {"schema": os.environ["DB_SCHEMA"]}
     id = db.Column(db.Integer, primary_key=True, unique=True)
     email = db.Column(db.String(200), unique=True, nullable=False)
     public_key = db.Column(db.Text, unique=True, nullable=True)
-    API_KEY = db.Column(db.String(100), nullable=True)
+    API_KEY = db.Column(db.String(100), nullable=True, unique=True, index=True)
     API_SECRET = db.Column(BYTEA, nullable=True)
     enabled = db.Column(db.Boolean, nullable=False, default=True)
 
@@ -48,12 +59,53 @@ class User(db.Model, flask_login.UserMixin):
         assert value != ""
         return value
 
+    @validates("enabled")
+    def validate_enabled(self, key, value):
+        self.invalidate_credentials()
+        return value
+
     def is_active(self):
         return self.enabled
 
     def check_password(self, api_secret):
         return bcrypt.checkpw(api_secret.encode(), self.API_SECRET)
 
+    def invalidate_credentials(self):
+        """
+        Remove any verified credentials of this user from the credential
+        cache of this process.
+        """
+        if self.API_KEY is not None:
+            api_key = self.API_KEY
+            credential_cache.delete_matching(lambda x: x[0] == api_key)
+
+    def _get_permission_index(self):
+        """
+        Get the sets used to answer permission checks. These are built once
+        from the roles of the user, and rebuilt whenever the roles collection
+        is reloaded or changed.
+
+        :returns:   Tuple containing the set of global roles and the set of
+                    (role, subject_type, subject_id) tuples. Subject roles are
+                    also stored with role None, to allow checking for any
+                    role on a subject.
+        """
+        roles = self.roles
+        index = getattr(self, "_permission_index", None)
+        if index is not None and index[0] is roles:
+            return index[1], index[2]
+
+        global_roles = set()
+        subject_roles = set()
+        for x in roles:
+            if x.subject_type is None and x.subject_id is None:
+                global_roles.add(x.role)
+            subject_roles.add((x.role, x.subject_type, x.subject_id))
+            subject_roles.add((None, x.subject_type, x.subject_id))
+
+        self._permission_index = (roles, global_roles, subject_roles)
+        return global_roles, subject_roles
+
     def has_role(self, role):
         """
         Check if a user has a specific role, but only when no subject is set
@@ -62,10 +114,7 @@ class User(db.Model, flask_login.UserMixin):
         :param role:            Name of the role
         :returns:               Boolean indicating access.
         """
-        return any([
-            x.role == role and x.subject_type is None and x.subject_id is None
-            for x in self.roles
-        ])
+        return role in self._get_permission_index()[0]
 
     def has_role_on_subject(self, role, subject_type, subject_id):
         """
@@ -77,27 +126,8 @@ class User(db.Model, flask_login.UserMixin):
         :param subject_id:      ID of the role subject
         :returns:               Boolean indicating access.
         """
-        return any([
-            x.has_role_on_subject(role, subject_type, subject_id)
-            for x in self.roles
-        ])
-
-    def has_access_to_image(self, image):
-        """
-        Validate that this user has access to a given image, by checking
-        if the image is part of any campaigns that this user has access to.
-
-        :param image:       The image object to verify
-        :returns:           Boolean indicating access.
-        """
-        return any([
-            self.has_role_on_subject(
-                "labeler",
-                "campaign",
-                campaign_image.campaign_id
-            )
-            for campaign_image in image.campaign_images
-        ])
+        return (role, subject_type, subject_id) in \
+            self._get_permission_index()[1]
 
     def generate_api_key(self):
         """
@@ -109,7 +139,8 @@ class User(db.Model, flask_login.UserMixin):
         """
         api_key = secrets.token_hex(16)
         api_secret = secrets.token_hex(16)
-        hashed = bcrypt.hashpw(api_secret.encode(), bcrypt.gensalt())
+        hashed = hash_secret(api_secret)
+        self.invalidate_credentials()
         self.API_KEY = api_key
         self.API_SECRET = hashed
         db.session.commit()
@@ -118,6 +149,20 @@ class User(db.Model, flask_login.UserMixin):
 
         return api_key, api_secret
 
+    @staticmethod
+    def find_by_api_key(api_key):
+        """
+        Find the user for an API key. The roles of the user are loaded in the
+        same query, as they are needed for nearly every authorization check.
+
+        :param api_key:     The API key to look up
+        :returns:           The user, or None if the key is unknown
+        """
+        return User.query\
+            .options(db.joinedload(User.roles))\
+            .filter(User.API_KEY == api_key)\
+            .one_or_none()
+
     @staticmethod
     def find_or_create(email, commit=True):
         user = User.query.filter(User.email == email).first()
@@ -129,6 +174,108 @@ class User(db.Model, flask_login.UserMixin):
 
         return user
 
+    @staticmethod
+    def provision(users, executor=None):
+        """
+        Create users and their roles in bulk. Users that already exist are
+        reused, and only roles they don't have yet are added. Users without an
+        API key get one. The secrets are hashed in parallel, and everything is
+        stored in a single transaction.
+
+        :param users:       List of dicts with "email" and optionally "roles":
+                            a list of dicts with "role" and optionally
+                            "subject_type" and "subject_id".
+        :param executor:    concurrent.futures executor used to hash the
+                            secrets. Defaults to a thread pool, as bcrypt
+                            releases the GIL while hashing.
+        :returns boolean:   Success or not
+        :returns int:       Status code in case of failure - 422 if a role is
+                            invalid
+        :returns:           Error message in case of failure, otherwise a list
+                            of dicts with "email", "apikey" and "apisecret".
+                            Like in Campaign.create, the secret is only
+                            provided for newly generated keys.
+        """
+        # Combine the roles of users that are provided more than once
+        requested = {}
+        for u in users:
+            roles = requested.setdefault(u["email"], set())
+            for r in u.get("roles", []):
+                role = (
+                    r["role"],
+                    r.get("subject_type"),
+                    r.get("subject_id")
+                )
+                if role[0] not in ("image-admin", "labeler"):
+                    return False, 422, f"Unknown role {role[0]}"
+                if (role[1] is None) != (role[2] is None):
+                    return False, 422, \
+                        "Provide both subject_type and subject_id, or neither"
+                roles.add(role)
+
+        existing = {
+            x.email: x
+            for x in User.query
+                         .options(db.joinedload(User.roles))
+                         .filter(User.email.in_(list(requested.keys())))
+                         .all()
+        }
+
+        # Create new users, and generate keys for users that don't have one
+        result = []
+        needs_key = []
+        for email, roles in requested.items():
+            user = existing.get(email)
+            if user is None:
+                user = User(email=email)
+                db.session.add(user)
+
+            current = {
+                (x.role, x.subject_type, x.subject_id) for x in user.roles
+            }
+            for role, subject_type, subject_id in roles - current:
+                db.session.add(Role(
+                    role=role,
+                    user=user,
+                    subject_type=subject_type,
+                    subject_id=subject_id
+                ))
+
+            if user.API_KEY is None:
+                needs_key.append((user, secrets.token_hex(16)))
+            result.append(user)
+
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        with executor:
+            hashes = executor.map(hash_secret, [x[1] for x in needs_key])
+            for (user, api_secret), hashed in zip(needs_key, hashes):
+                user.API_KEY = secrets.token_hex(16)
+                user.API_SECRET = hashed
+
+        generated = {user.email: api_secret for user, api_secret in needs_key}
+        response = [
+            {
+                "email": x.email,
+                "apikey": x.API_KEY,
+                "apisecret": generated.get(x.email)
+            }
+            for x in result
+        ]
+
+        db.session.commit()
+
+        logger.info(f"Provisioned {len(result)} users, generated "
+                    f"{len(needs_key)} new API keys")
+
+        return True, None, response
+
+
+@event.listens_for(User.roles, "append")
+@event.listens_for(User.roles, "remove")
+def reset_permission_index(user, role, initiator):
+    user._permission_index = None
+
 
 class Role(db.Model):
     __tablename__ = "roles"
@@ -140,7 +287,7 @@ class Role(db.Model):
     )
     user_id = db.Column(
         db.Integer, db.ForeignKey(f"{os.environ['DB_SCHEMA']}.user.id"),
-        nullable=False)
+        nullable=False, index=True)
     subject_type = db.Column(db.String(128))
     subject_id = db.Column(db.Integer)
 
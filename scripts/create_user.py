@@ -14,15 +14,83 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from models.user import User, Role
+"""
+Create users and their API keys.
+
+Create a single image-admin:
+    python -m scripts.create_user --email admin@example.com
+
+Provision users in bulk from a CSV file (columns: email, role, subject_type,
+subject_id - one row per role) or a JSONL file (one object per line, in the
+same format as the body of POST /users):
+    python -m scripts.create_user --file labelers.csv --output credentials.csv
+
+The credentials of the users are written as CSV (email, apikey, apisecret).
+Like in the API, the secret is only known for newly generated keys.
+"""
+
+from models.user import User
 from main import app
-from common.db import db
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import csv
+import sys
+
+
+def read_csv(f):
+    users = []
+    for row in csv.DictReader(f):
+        user = {"email": row["email"], "roles": []}
+        if row.get("role"):
+            user["roles"].append({
+                "role": row["role"],
+                "subject_type": row.get("subject_type") or None,
+                "subject_id": int(row["subject_id"])
+                if row.get("subject_id") else None
+            })
+        users.append(user)
+    return users
+
+
+def read_jsonl(f):
+    return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create users and API keys")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--email", help="Create a single image-admin user")
+    group.add_argument("--file", help="CSV or JSONL file with users to create")
+    parser.add_argument("--output", help="File to write the credentials to "
+                                         "(defaults to stdout)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of processes used to hash the secrets")
+    args = parser.parse_args()
+
+    if args.email:
+        users = [{"email": args.email, "roles": [{"role": "image-admin"}]}]
+    else:
+        with open(args.file) as f:
+            if args.file.endswith(".jsonl"):
+                users = read_jsonl(f)
+            else:
+                users = read_csv(f)
+
+    with app.app_context():
+        success, sc, response = User.provision(
+            users, executor=ProcessPoolExecutor(max_workers=args.processes))
+
+    if not success:
+        sys.exit(f"Failed to create users: {response}")
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = csv.DictWriter(out, fieldnames=["email", "apikey", "apisecret"])
+    writer.writeheader()
+    writer.writerows(response)
+    if args.output:
+        out.close()
 
-email = ""
 
-with app.app_context():
-    user = User.find_or_create(email)
-    api_key, api_secret = user.generate_api_key()
-    print(f"User credentials:\n\tAPI Key: {api_key}\n\tAPI secret: {api_secret}")
-    role = Role(role="image-admin", user=user)
-    db.session.commit()
+if __name__ == "__main__":
+    main()
@@ -18,10 +18,31 @@ from models.user import User, Role
 from models.image import Image, ImageSet
 from models.campaign import Campaign, CampaignImage
 from models.object import Object
+from contextlib import contextmanager
+import sqlalchemy
 import bcrypt
 import datetime
 
 
+@contextmanager
+def count_queries(db):
+    """
+    Collect all SQL statements that are executed within the context.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sqlalchemy.event.listen(
+        db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sqlalchemy.event.remove(
+            db.engine, "before_cursor_execute", before_cursor_execute)
+
+
 def get_headers(db):
     api_key = "123"
     api_secret = "foobar"
@@ -216,6 +237,8 @@ def add_image_to_campaign(db, image, campaign):
         labeled=True
     )
     db.session.add(campaign_image)
+    campaign.image_count += 1
+    campaign.labeled_count += 1
     db.session.commit()
     return campaign_image
 
@@ -254,6 +277,7 @@ def create_basic_testset(db, obj=True):
                           [6, 7, 8, 9])
 
     ci2.labeled = False
+    campaign3.labeled_count -= 1
     db.session.commit()
     return now, yesterday
 
@@ -0,0 +1,203 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from tests.shared import get_headers, add_labeler_user, create_basic_testset, \
+    count_queries
+from models.user import User, Role
+from common.cache import credential_cache
+import bcrypt
+
+
+def test_credentials_cached(client, app, db, mocker):
+    headers = get_headers(db)
+
+    mocker.spy(bcrypt, "checkpw")
+
+    response = client.get("/api/v1/images", headers=headers)
+    assert response.status_code == 200
+    response = client.get("/api/v1/images", headers=headers)
+    assert response.status_code == 200
+
+    # Only the first request should have done the full check
+    assert bcrypt.checkpw.call_count == 1
+    assert len(credential_cache) == 1
+
+
+def test_credentials_cache_wrong_secret(client, app, db, mocker):
+    headers = get_headers(db)
+
+    response = client.get("/api/v1/images", headers=headers)
+    assert response.status_code == 200
+
+    # A cached key must not make a different secret valid
+    headers["Authentication-Secret"] = "Foobaz"
+    response = client.get("/api/v1/images", headers=headers)
+    assert response.status_code == 401
+
+
+def test_credentials_cache_invalidated_on_disable(client, app, db, mocker):
+    headers = get_headers(db)
+
+    response = client.get("/api/v1/images", headers=headers)
+    assert response.status_code == 200
+    assert len(credential_cache) == 1
+
+    user = db.session.query(User)\
+                     .filter(User.email == "test@example.com")\
+                     .first()
+    user.enabled = False
+    db.session.commit()
+
+    assert len(credential_cache) == 0
+
+    response = client.get("/api/v1/images", headers=headers)
+    assert response.status_code == 401
+
+
+def test_credentials_cache_invalidated_on_new_key(client, app, db, mocker):
+    headers = get_headers(db)
+
+    response = client.get("/api/v1/images", headers=headers)
+    assert response.status_code == 200
+
+    user = db.session.query(User)\
+                     .filter(User.email == "test@example.com")\
+                     .first()
+    api_key, api_secret = user.generate_api_key()
+
+    assert len(credential_cache) == 0
+
+    response = client.get("/api/v1/images", headers=headers)
+    assert response.status_code == 401
+
+    response = client.get("/api/v1/images", headers={
+        "Authentication-Key": api_key,
+        "Authentication-Secret": api_secret
+    })
+    assert response.status_code == 200
+
+
+def get_token(client, headers):
+    response = client.post("/api/v1/auth/token", headers=headers)
+    assert response.status_code == 200
+    assert response.json["token_type"] == "Bearer"
+    assert response.json["expires_in"] == 900
+    return {"Authorization": "Bearer " + response.json["access_token"]}
+
+
+def test_access_token(client, app, db, mocker):
+    headers = get_headers(db)
+    token_headers = get_token(client, headers)
+
+    mocker.spy(bcrypt, "checkpw")
+
+    response = client.get("/api/v1/images", headers=token_headers)
+    assert response.status_code == 200
+
+    bcrypt.checkpw.assert_not_called()
+
+
+def test_access_token_role_snapshot(client, app, db, mocker):
+    now, yesterday = create_basic_testset(db)
+    headers = add_labeler_user(db, "campaign", 3)
+    token_headers = get_token(client, headers)
+
+    response = client.get("/api/v1/campaigns/3/images", headers=token_headers)
+    assert response.status_code == 200
+
+    response = client.get("/api/v1/campaigns/2/images", headers=token_headers)
+    assert response.status_code == 401
+
+    # Labeler is no image-admin
+    response = client.get("/api/v1/images", headers=token_headers)
+    assert response.status_code == 401
+
+
+def test_access_token_invalid(client, app, db, mocker):
+    headers = get_headers(db)
+    token_headers = get_token(client, headers)
+
+    token_headers["Authorization"] += "x"
+    response = client.get("/api/v1/images", headers=token_headers)
+    assert response.status_code == 401
+
+
+def test_access_token_expired(client, app, db, mocker, monkeypatch):
+    headers = get_headers(db)
+    token_headers = get_token(client, headers)
+
+    monkeypatch.setenv("ACCESS_TOKEN_VALID_SECONDS", "-1")
+    response = client.get("/api/v1/images", headers=token_headers)
+    assert response.status_code == 401
+
+
+def test_access_token_not_renewable(client, app, db, mocker):
+    headers = get_headers(db)
+    token_headers = get_token(client, headers)
+
+    response = client.post("/api/v1/auth/token", headers=token_headers)
+    assert response.status_code == 401
+
+
+def test_access_token_not_configured(client, app, db, mocker, monkeypatch):
+    headers = get_headers(db)
+
+    monkeypatch.delenv("ACCESS_TOKEN_SECRET")
+    response = client.post("/api/v1/auth/token", headers=headers)
+    assert response.status_code == 503
+
+
+def test_find_by_api_key_single_query(client, app, db, mocker):
+    get_headers(db)
+    db.session.expunge_all()
+
+    with count_queries(db) as queries:
+        user = User.find_by_api_key("123")
+        assert user.has_role("image-admin")
+
+    assert len(queries) == 1
+
+
+def test_find_by_api_key_unknown(client, app, db, mocker):
+    get_headers(db)
+
+    assert User.find_by_api_key("124") is None
+
+
+def test_permission_index(client, app, db, mocker):
+    get_headers(db)
+    user = User.find_by_api_key("123")
+
+    assert user.has_role("image-admin")
+    assert not user.has_role("labeler")
+    assert not user.has_role_on_subject("labeler", "campaign", 3)
+
+    # Adding a role should be reflected in the next check
+    db.session.add(Role(
+        role="labeler",
+        user=user,
+        subject_type="campaign",
+        subject_id=3
+    ))
+    assert user.has_role_on_subject("labeler", "campaign", 3)
+    assert user.has_role_on_subject(None, "campaign", 3)
+    assert not user.has_role_on_subject("image-admin", "campaign", 3)
+    assert not user.has_role_on_subject("labeler", "campaign", 2)
+    assert not user.has_role("labeler")
+
+    # As well as after reloading the roles from the database
+    db.session.commit()
+    assert user.has_role_on_subject("labeler", "campaign", 3)
@@ -0,0 +1,142 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from common.azure import AzureWrapper
+import base64
+import json
+import time
+import os
+
+
+def test_export_labels_to_ML(app, mocker):
+    os.environ["AZURE_ML_SUBSCRIPTION_ID"] = "subscription"
+    os.environ["AZURE_ML_RESOURCE_GROUP"] = "group"
+    os.environ["AZURE_ML_WORKSPACE_NAME"] = "workspace"
+    os.environ["AZURE_ML_DATASTORE"] = "datastore"
+
+    mocker.patch("common.azure.AzureWrapper._get_workspace")
+    datastore = mocker.Mock()
+    mocker.patch(
+        "common.azure.AzureWrapper._get_datastore",
+        return_value=datastore
+    )
+    mocker.patch("common.azure.AzureWrapper._get_tabular_dataset")
+
+    # Read the file while it still exists
+    uploaded = {}
+
+    def upload_files(files, relative_root, target_path, overwrite):
+        assert files == [os.path.join(relative_root, "some-set_labels.csv")]
+        assert os.listdir(relative_root) == ["some-set_labels.csv"]
+        with open(files[0]) as f:
+            uploaded["content"] = f.read()
+        uploaded["directory"] = relative_root
+
+    datastore.upload_files.side_effect = upload_files
+
+    def labels():
+        yield {
+            "image_url": "path/file1.png",
+            "label": [{"label": "label1", "bottomX": 1, "topX": 2,
+                       "bottomY": 3, "topY": 4}],
+            "label_confidence": [None]
+        }
+        yield {
+            "image_url": "path/file2.png",
+            "label": [],
+            "label_confidence": []
+        }
+
+    AzureWrapper.export_labels_to_ML("some-set_labels", "Some set", labels())
+
+    assert uploaded["content"] == \
+        'image_url,label,label_confidence\n' \
+        'path/file1.png,"[{\'label\': \'label1\', \'bottomX\': 1, ' \
+        '\'topX\': 2, \'bottomY\': 3, \'topY\': 4}]",[None]\n' \
+        'path/file2.png,[],[]\n'
+    assert not os.path.exists(uploaded["directory"])
+    AzureWrapper._get_tabular_dataset.assert_called_once_with(
+        datastore, "some-set_labels")
+
+
+def get_token_header(expires):
+    payload = base64.urlsafe_b64encode(
+        json.dumps({"exp": expires}).encode()).decode().rstrip("=")
+    return {"Authorization": f"Bearer header.{payload}.signature"}
+
+
+def test_get_workspace_cached(app, mocker):
+    os.environ["AZURE_ML_SP_TENANT_ID"] = "tenant"
+    os.environ["AZURE_ML_SP_APPLICATION_ID"] = "application"
+
+    auth = mocker.patch("common.azure.ServicePrincipalAuthentication")
+    auth.return_value.get_authentication_header.return_value = \
+        get_token_header(time.time() + 3600)
+    workspace = mocker.patch("common.azure.Workspace")
+    datastore = mocker.patch("common.azure.Datastore.get")
+
+    ws = AzureWrapper._get_workspace("subscription", "group", "workspace")
+    assert AzureWrapper._get_workspace(
+        "subscription", "group", "workspace") is ws
+    assert AzureWrapper._get_datastore(ws, "datastore") is \
+        AzureWrapper._get_datastore(ws, "datastore")
+
+    auth.assert_called_once()
+    assert auth.call_args[1]["_enable_caching"] is True
+    workspace.assert_called_once()
+    datastore.assert_called_once_with(ws, "datastore")
+
+    # Another workspace is loaded separately
+    AzureWrapper._get_workspace("subscription", "group", "other")
+    assert workspace.call_count == 2
+
+
+def test_get_workspace_token_expired(app, mocker):
+    os.environ["AZURE_ML_SP_TENANT_ID"] = "tenant"
+    os.environ["AZURE_ML_SP_APPLICATION_ID"] = "application"
+
+    # The token expires within the refresh margin, so the workspace is not
+    # reused
+    auth = mocker.patch("common.azure.ServicePrincipalAuthentication")
+    auth.return_value.get_authentication_header.return_value = \
+        get_token_header(time.time() + 60)
+    workspace = mocker.patch("common.azure.Workspace")
+
+    AzureWrapper._get_workspace("subscription", "group", "workspace")
+    AzureWrapper._get_workspace("subscription", "group", "workspace")
+
+    assert workspace.call_count == 2
+
+
+def test_get_blob_service_shared(app, mocker):
+    mocker.patch("common.azure._blob_service", None)
+    service = mocker.patch("common.azure.BlockBlobService")
+    os.environ["AZURE_STORAGE_POOL_SIZE"] = "4"
+    try:
+        first = AzureWrapper._get_blob_service()
+        assert AzureWrapper._get_blob_service() is first
+    finally:
+        del os.environ["AZURE_STORAGE_POOL_SIZE"]
+
+    service.assert_called_once()
+    session = service.call_args[1]["request_session"]
+    assert session.get_adapter("https://account.blob.core.windows.net")\
+        ._pool_maxsize == 4
+
+    # A forked process creates its own service
+    mocker.patch("common.azure.os.getpid", return_value=-1)
+    AzureWrapper._get_blob_service()
+    assert service.call_count == 2
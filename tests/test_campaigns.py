@@ -16,11 +16,17 @@
 
 from tests.shared import get_headers, add_user, add_imagesets, add_images, \
     add_campaigns, add_image_to_campaign, add_object, add_labeler_user, \
-    create_basic_testset, add_images_campaigns
-from models.campaign import Campaign, CampaignImage
+    create_basic_testset, add_images_campaigns, count_queries
+from models.campaign import Campaign, CampaignImage, CampaignExport
 from models.user import User, Role
+from models.image import Image
+from models.object import Object
+from models.job import Job
 from common.azure import AzureWrapper
+from common.cache import count_cache
 import datetime
+import json
+import gzip
 import bcrypt
 
 
@@ -135,6 +141,41 @@ def test_list_campaigns_pagination(client, app, db, mocker):
     assert response.json == expected
 
 
+def test_list_campaigns_query_count(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+
+    db.session.expire_all()
+    with count_queries(db) as statements:
+        response = client.get("/api/v1/campaigns", headers=headers)
+    assert response.status_code == 200
+    expected_count = len(statements)
+
+    # More campaigns, by another user and with more images, should not lead
+    # to more queries
+    user = User(email="other@example.com")
+    campaign = Campaign(title="a-fourth-campaign", created_by=user)
+    db.session.add(campaign)
+    db.session.commit()
+    for image in Image.query.all():
+        add_image_to_campaign(db, image, campaign)
+
+    # Added directly in the database, so the cached count is outdated
+    count_cache.clear()
+    db.session.expire_all()
+    with count_queries(db) as statements:
+        response = client.get("/api/v1/campaigns", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json["campaigns"]) == 4
+    assert response.json["campaigns"][3]["created_by"] == "other@example.com"
+    assert response.json["campaigns"][3]["progress"] == {
+        "total": 3,
+        "done": 3
+    }
+    assert len(statements) == expected_count
+
+
 def test_new_campaign(client, app, db, mocker):
     headers = get_headers(db)
 
@@ -500,10 +541,6 @@ def test_change_campaign_status_completed_to_finished(client, app, db, mocker):
         "new_status": "finished"
     }
 
-    mocker.patch(
-        "models.campaign.Campaign.finish_campaign"
-    )
-
     assert campaign1.date_finished is None
 
     response = client.put(
@@ -513,7 +550,16 @@ def test_change_campaign_status_completed_to_finished(client, app, db, mocker):
     assert campaign1.status == "finished"
     assert campaign1.date_finished is not None
 
-    Campaign.finish_campaign.assert_called_once()
+    job = Job.query.filter(Job.type == "finish_campaign").one()
+    assert job.payload == {"campaign_id": 1}
+    assert job.status == "queued"
+
+    exports = Job.query.filter(Job.type == "export_campaign")\
+                       .order_by(Job.id).all()
+    assert [x.payload for x in exports] == [
+        {"campaign_id": 1, "format": "coco"},
+        {"campaign_id": 1, "format": "parquet"}
+    ]
 
 
 def test_change_campaign_status_created_to_active(client, app, db, mocker):
@@ -575,16 +621,63 @@ def test_change_campaign_status_invalid(client, app, db, mocker):
         "new_status": "finished"
     }
 
-    mocker.patch(
-        "models.campaign.Campaign.finish_campaign"
-    )
-
     response = client.put(
         "/api/v1/campaigns/1", json=json_payload, headers=headers)
     assert response.status_code == 409
     assert campaign1.status == "active"
 
-    Campaign.finish_campaign.assert_not_called()
+    assert Job.query.count() == 0
+
+
+def test_export_campaign_objects(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+    campaign3 = db.session.query(Campaign).get(3)
+    db.session.add(CampaignImage(
+        campaign=campaign3,
+        image=Image.query.get(3),
+        labeled=False
+    ))
+    db.session.commit()
+
+    with count_queries(db) as statements:
+        response = client.get("/api/v1/campaigns/3/export", headers=headers)
+        assert response.status_code == 200
+        data = response.data
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers["Content-Encoding"] == "gzip"
+
+    records = [
+        json.loads(x) for x in gzip.decompress(data).decode().splitlines()
+    ]
+    assert [x["image_id"] for x in records] == [1, 2, 3]
+    assert records[0]["url"] == "/images/1"
+    assert [x["object_id"] for x in records[0]["objects"]] == [1, 2]
+    assert records[1]["objects"] == [
+        {
+            "object_id": 3,
+            "image_id": 2,
+            "campaign_id": 3,
+            "label": "translated_label3",
+            "bounding_box": {
+                "xmin": 6,
+                "xmax": 7,
+                "ymin": 8,
+                "ymax": 9
+            },
+            "confidence": 0.87,
+            "date_added": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        }
+    ]
+    assert records[2]["objects"] == []
+
+    # The images and objects are read in a single query
+    campaign_image_table = f"FROM {CampaignImage.__table__.fullname} "
+    assert len([x for x in statements if campaign_image_table in x]) == 1
+
+    response = client.get("/api/v1/campaigns/1234/export", headers=headers)
+    assert response.status_code == 404
 
 
 def test_campaign_finish(client, app, db, mocker):
@@ -598,8 +691,15 @@ def test_campaign_finish(client, app, db, mocker):
     mocker.patch(
         "models.campaign.AzureWrapper.export_images_to_ML"
     )
+    # The labels are generated while exporting, so consume them in the mock
+    exported = []
+    mocker.patch(
+        "models.campaign.AzureWrapper.export_labels_to_ML",
+        side_effect=lambda name, description, labels:
+            exported.extend(labels)
+    )
     mocker.patch(
-        "models.campaign.AzureWrapper.export_labels_to_ML"
+        "models.campaign.AzureWrapper.upload_to_datastore"
     )
 
     campaign3.finish_campaign(app, db, 3, campaign3.title)
@@ -614,42 +714,174 @@ def test_campaign_finish(client, app, db, mocker):
         "a-third-campaign_labels",
         "Exported labels as result of the finishing of labeling campaign "
         "a-third-campaign",
-        [
-            {
-                "image_url": "path/file1.png",
-                "label": [
-                    {
-                        "label": "label1",
-                        "bottomX": 1,
-                        "topX": 2,
-                        "bottomY": 3,
-                        "topY": 4
-                    },
-                    {
-                        "label": "label2",
-                        "bottomX": 2,
-                        "topX": 3,
-                        "bottomY": 4,
-                        "topY": 5
-                    }
-                ],
-                "label_confidence": [None, None]
-            },
-            {
-                "image_url": "otherpath/file2.png",
-                "label": [
-                    {
-                        "label": "translated_label3",
-                        "bottomX": 6,
-                        "topX": 7,
-                        "bottomY": 8,
-                        "topY": 9
-                    }
-                ],
-                "label_confidence": [0.87]
-            }
-        ]
+        mocker.ANY
     )
+    assert exported == [
+        {
+            "image_url": "path/file1.png",
+            "label": [
+                {
+                    "label": "label1",
+                    "bottomX": 1,
+                    "topX": 2,
+                    "bottomY": 3,
+                    "topY": 4
+                },
+                {
+                    "label": "label2",
+                    "bottomX": 2,
+                    "topX": 3,
+                    "bottomY": 4,
+                    "topY": 5
+                }
+            ],
+            "label_confidence": [None, None]
+        },
+        {
+            "image_url": "otherpath/file2.png",
+            "label": [
+                {
+                    "label": "translated_label3",
+                    "bottomX": 6,
+                    "topX": 7,
+                    "bottomY": 8,
+                    "topY": 9
+                }
+            ],
+            "label_confidence": [0.87]
+        }
+    ]
+
+    export = CampaignExport.query.one()
+    assert export.campaign_id == 3
+    assert export.sequence == 1
+    assert export.kind == "full"
+    assert export.dataset == "a-third-campaign_labels"
+    AzureWrapper.upload_to_datastore.assert_called_once_with(
+        [mocker.ANY], mocker.ANY, "label_sets")
+
+
+def test_campaign_finish_queries(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+    campaign3 = db.session.query(Campaign).get(3)
+
+    mocker.patch(
+        "models.campaign.AzureWrapper.export_images_to_ML"
+    )
+    mocker.patch(
+        "models.campaign.AzureWrapper.export_labels_to_ML",
+        side_effect=lambda name, description, labels: list(labels)
+    )
+    mocker.patch(
+        "models.campaign.AzureWrapper.upload_to_datastore"
+    )
+
+    title = campaign3.title
+    with count_queries(db) as statements:
+        campaign3.finish_campaign(app, db, 3, title)
+    expected_count = len(statements)
+
+    # More images and objects should not lead to more queries
+    campaign3 = db.session.query(Campaign).get(3)
+    for image in Image.query.all():
+        if image.id not in (1, 2):
+            add_image_to_campaign(db, image, campaign3)
+    for c_image in CampaignImage.query.filter(
+            CampaignImage.campaign_id == 3).all():
+        add_object(db, now, c_image, "label4", None, 0.5, [1, 2, 3, 4])
+    CampaignExport.query.delete()
+    db.session.commit()
+
+    with count_queries(db) as statements:
+        campaign3.finish_campaign(app, db, 3, title)
+    assert len(statements) == expected_count
+
+    # The paths and labels queries, plus the previous export, the watermark,
+    # inserting the export and reading the exports for the manifest
+    assert expected_count <= 7
+
+
+def test_campaign_finish_delta(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+    campaign3 = db.session.query(Campaign).get(3)
+    title = campaign3.title
+
+    mocker.patch(
+        "models.campaign.AzureWrapper.export_images_to_ML"
+    )
+    exported = {}
+    mocker.patch(
+        "models.campaign.AzureWrapper.export_labels_to_ML",
+        side_effect=lambda name, description, labels:
+            exported.setdefault(name, list(labels))
+    )
+    manifests = []
+
+    def upload_to_datastore(files, relative_root, target_path):
+        with open(files[0]) as f:
+            manifests.append(json.load(f))
+
+    mocker.patch(
+        "models.campaign.AzureWrapper.upload_to_datastore",
+        side_effect=upload_to_datastore
+    )
+
+    campaign3.finish_campaign(app, db, 3, title)
+    assert len(exported["a-third-campaign_labels"]) == 2
+
+    # Correct the objects of one image
+    campaign3 = db.session.query(Campaign).get(3)
+    campaign3.status = "active"
+    db.session.commit()
+    json_payload = [
+        {
+            "image_id": 2,
+            "objects": [
+                {
+                    "bounding_box": {
+                        "xmin": 23, "xmax": 98, "ymin": 1000, "ymax": 1023
+                    },
+                    "label": "Plastic"
+                }
+            ]
+        }
+    ]
+    response = client.put(
+        "/api/v1/campaigns/3/objects", json=json_payload, headers=headers)
+    assert response.status_code == 200
+
+    campaign3.finish_campaign(app, db, 3, title)
+    AzureWrapper.export_images_to_ML.assert_called_once()
+    assert exported["a-third-campaign_labels_delta_2"] == [
+        {
+            "image_url": "otherpath/file2.png",
+            "label": [
+                {
+                    "label": "Plastic",
+                    "bottomX": 23,
+                    "topX": 98,
+                    "bottomY": 1000,
+                    "topY": 1023
+                }
+            ],
+            "label_confidence": [None]
+        }
+    ]
+    assert [(x["sequence"], x["kind"], x["dataset"])
+            for x in manifests[-1]["exports"]] == [
+        (1, "full", "a-third-campaign_labels"),
+        (2, "delta", "a-third-campaign_labels_delta_2")
+    ]
+
+    # Nothing changed since, so nothing is exported
+    campaign3.finish_campaign(app, db, 3, title)
+    assert AzureWrapper.export_labels_to_ML.call_count == 2
+    assert len(manifests) == 2
+    assert CampaignExport.query.count() == 2
 
 
 def test_add_images_to_campaign_by_id(client, app, db, mocker):
@@ -672,6 +904,60 @@ def test_add_images_to_campaign_by_id(client, app, db, mocker):
     assert img1 in images
     assert img3 in images
     assert img2 not in images
+    assert campaign3.image_count == 2
+    assert campaign3.labeled_count == 0
+
+
+def test_add_images_to_campaign_already_added(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+
+    # Image 1 is already part of campaign 3, so only image 3 is added
+    json_payload = [
+        {"id": 1},
+        {"id": 3}
+    ]
+
+    response = client.post(
+        "/api/v1/campaigns/3/images", json=json_payload, headers=headers)
+    assert response.status_code == 200
+
+    campaign = Campaign.query.get(3)
+    assert len(campaign.campaign_images) == 3
+    assert campaign.image_count == 3
+    assert campaign.labeled_count == 1
+
+
+def test_add_images_to_campaign_query_count(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday, user, img1, img2, img3, campaign1, campaign2, campaign3 = \
+        add_images_campaigns(db)
+    add_image_to_campaign(db, img2, campaign3)
+
+    json_payload = [
+        {"id": 1},
+        {"id": 2},
+        {"filepath": "/some/otherpath/file3.png"},
+        {"filepath": "/some/path/file1.png"}
+    ]
+
+    with count_queries(db) as statements:
+        response = client.post(
+            "/api/v1/campaigns/3/images", json=json_payload, headers=headers)
+    assert response.status_code == 200
+
+    # One insert for all new images, and a single query each for the ids,
+    # the filepaths and the images already in the campaign
+    inserts = [x for x in statements if x.startswith("INSERT")]
+    assert len(inserts) == 1
+    image_table = f"FROM {Image.__table__.fullname} "
+    assert len([x for x in statements if image_table in x]) == 2
+
+    campaign = Campaign.query.get(3)
+    assert sorted(x.image_id for x in campaign.campaign_images) == [1, 2, 3]
+    assert campaign.image_count == 3
 
 
 def test_add_images_to_campaign_by_blobstorage_path(client, app, db, mocker):
@@ -726,13 +1012,16 @@ def test_add_images_to_campaign_doesnt_exist(client, app, db, mocker):
 
     json_payload = [
         {"id": 3},
-        {"id": 10}
+        {"id": 10},
+        {"filepath": "/some/path/doesnt-exist.png"},
+        {"id": 11}
     ]
 
     response = client.post(
         "/api/v1/campaigns/3/images", json=json_payload, headers=headers)
     assert response.status_code == 404
-    assert response.json["detail"] == "Unknown image provided"
+    assert response.json["detail"] == \
+        "Unknown images provided: 10, 11, /some/path/doesnt-exist.png"
 
     # Verify that no images where added at all
     assert len(campaign3.campaign_images) == 0
@@ -837,6 +1126,35 @@ def test_get_objects_in_campaign(client, app, db, mocker):
     assert response.json == expected
 
 
+def test_get_objects_in_campaign_query_count(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+
+    db.session.expire_all()
+    with count_queries(db) as statements:
+        response = client.get("/api/v1/campaigns/3/objects", headers=headers)
+    assert response.status_code == 200
+    expected_count = len(statements)
+
+    # More images and objects in the campaign should not lead to more queries
+    campaign = Campaign.query.get(3)
+    ci = add_image_to_campaign(db, Image.query.get(3), campaign)
+    for i in range(5):
+        add_object(db, now, ci, f"label{i}", None, None, [i, i, i, i])
+
+    # Added directly in the database, so the cached count is outdated
+    count_cache.clear()
+    db.session.expire_all()
+    with count_queries(db) as statements:
+        response = client.get("/api/v1/campaigns/3/objects", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json["images"]) == 3
+    assert [x["label"] for x in response.json["images"][2]["objects"]] == \
+        [f"label{i}" for i in range(5)]
+    assert len(statements) == expected_count
+
+
 def test_get_images_in_campaign_with_campaign_key(client, app, db, mocker):
     now, yesterday = create_basic_testset(db)
 
@@ -899,6 +1217,98 @@ def test_get_images_in_campaign_with_campaign_key_paginated(
     assert response.json == expected
 
 
+def test_get_images_in_campaign_keyset_pagination(client, app, db, mocker):
+    now, yesterday = create_basic_testset(db)
+
+    # Add labeling user on campaign 3
+    headers = add_labeler_user(db, "campaign", 3)
+
+    response = client.get("/api/v1/campaigns/3/images?limit=1",
+                          headers=headers)
+    assert response.status_code == 200
+    assert response.json["images"] == [
+        {"image_id": 1, "url": "/images/1"}
+    ]
+    cursor = response.json["pagination"]["next"]
+
+    response = client.get(f"/api/v1/campaigns/3/images?cursor={cursor}",
+                          headers=headers)
+    assert response.status_code == 200
+    assert response.json == {
+        "pagination": {"limit": 1000, "next": None},
+        "images": [
+            {"image_id": 2, "url": "/images/2"}
+        ]
+    }
+
+
+def test_get_objects_in_campaign_keyset_pagination(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+
+    ci = CampaignImage.query.filter(CampaignImage.image_id == 1).first()
+    response = client.get(
+        f"/api/v1/campaigns/3/objects?after_id={ci.id}&limit=10",
+        headers=headers)
+    assert response.status_code == 200
+    assert response.json["pagination"] == {"limit": 10, "next": None}
+    assert [x["image_id"] for x in response.json["images"]] == [2]
+    assert [x["label"] for x in response.json["images"][0]["objects"]] == \
+        ["translated_label3"]
+
+
+def test_get_images_in_campaign_without_total(client, app, db, mocker):
+    now, yesterday = create_basic_testset(db)
+
+    # Add labeling user on campaign 3
+    headers = add_labeler_user(db, "campaign", 3)
+
+    with count_queries(db) as statements:
+        response = client.get(
+            "/api/v1/campaigns/3/images?per_page=1&include_total=false",
+            headers=headers)
+    assert response.status_code == 200
+    assert response.json["pagination"] == {
+        "page": 1,
+        "pages": 1,
+        "per_page": 1,
+        "next": 2,
+        "prev": None
+    }
+    assert not [x for x in statements if "count(*)" in x]
+
+
+def test_get_images_in_campaign_cached_total(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday, user, img1, img2, img3, campaign1, campaign2, campaign3 = \
+        add_images_campaigns(db)
+
+    response = client.get("/api/v1/campaigns/3/images", headers=headers)
+    assert response.status_code == 200
+    assert response.json["pagination"]["total"] == 0
+
+    # Total is served from the cache
+    with count_queries(db) as statements:
+        response = client.get(
+            "/api/v1/campaigns/3/images?limit=10&include_total=true",
+            headers=headers)
+    assert response.status_code == 200
+    assert response.json["pagination"]["total"] == 0
+    assert not [x for x in statements if "count(*)" in x]
+
+    # Adding images invalidates the cached total
+    response = client.post(
+        "/api/v1/campaigns/3/images", json=[{"id": 1}, {"id": 2}],
+        headers=headers)
+    assert response.status_code == 200
+
+    response = client.get("/api/v1/campaigns/3/images", headers=headers)
+    assert response.status_code == 200
+    assert response.json["pagination"]["total"] == 2
+
+
 def test_get_images_in_campaign_with_invalid_campaign_key(
         client, app, db, mocker):
     now, yesterday = create_basic_testset(db)
@@ -1014,6 +1424,10 @@ def test_add_objects_to_images_in_campaign_with_campaign_key(client, app, db,
     assert img2.objects[1].label_translated == "Metal" \
         and img2.objects[1].label_original == "Metal"
 
+    campaign = Campaign.query.get(3)
+    assert campaign.labeled_count == 2
+    assert campaign.image_count == 2
+
 
 def test_add_objects_to_images_in_campaign_with_user_key(client, app, db,
                                                          mocker):
@@ -1266,6 +1680,143 @@ def test_add_objects_to_images_in_campaign_overwrite_existing(client, app, db,
     assert img1.objects[0].label_translated == "Plastic"
     assert img1.objects[1].label_translated == "Organic"
 
+    # Image 1 was already labeled, so the progress didn't change
+    campaign = Campaign.query.get(3)
+    assert campaign.labeled_count == 1
+    assert campaign.image_count == 2
+    assert campaign.status == "active"
+
+
+def test_add_objects_to_images_in_campaign_bulk(client, app, db, mocker):
+    """
+    In this test we verify that objects are replaced with one delete and one
+    insert, and that the last submission for an image is leading.
+    """
+    headers = get_headers(db)
+
+    # Inserting the default objects in this test case
+    now, yesterday = create_basic_testset(db)
+
+    # Set campaign 3 to active
+    campaign = Campaign.query.get(3)
+    campaign.status = "active"
+    db.session.commit()
+
+    json_payload = [
+        {
+            "image_id": 1,
+            "objects": [
+                {
+                    "bounding_box": {
+                        "xmin": 123, "xmax": 256, "ymin": 187, "ymax": 231
+                    },
+                    "label": "Plastic"
+                }
+            ]
+        },
+        {
+            "image_id": 2,
+            "objects": [
+                {
+                    "bounding_box": {
+                        "xmin": 23, "xmax": 98, "ymin": 1000, "ymax": 1023
+                    },
+                    "label": "Metal"
+                }
+            ]
+        },
+        {
+            "image_id": 1,
+            "objects": [
+                {
+                    "bounding_box": {
+                        "xmin": 234, "xmax": 324, "ymin": 564, "ymax": 765
+                    },
+                    "label": "Organic"
+                }
+            ]
+        }
+    ]
+
+    with count_queries(db) as statements:
+        response = client.put(
+            "/api/v1/campaigns/3/objects", json=json_payload, headers=headers)
+    assert response.status_code == 200
+
+    object_table = Object.__table__.fullname
+    assert len([
+        x for x in statements if x.startswith(f"DELETE FROM {object_table}")
+    ]) == 1
+    assert len([
+        x for x in statements if x.startswith(f"INSERT INTO {object_table}")
+    ]) == 1
+
+    img1 = CampaignImage.query.filter(CampaignImage.image_id == 1).first()
+    img2 = CampaignImage.query.filter(CampaignImage.image_id == 2).first()
+
+    assert [x.label_translated for x in img1.objects] == ["Organic"]
+    assert [x.label_translated for x in img2.objects] == ["Metal"]
+    assert img2.labeled
+
+    campaign = Campaign.query.get(3)
+    assert campaign.labeled_count == 2
+    assert campaign.status == "completed"
+    assert campaign.date_completed is not None
+
+
+def test_add_objects_to_images_in_campaign_unchanged(client, app, db,
+                                                    mocker):
+    """
+    In this test we verify that images for which the same objects are
+    submitted again are not rewritten.
+    """
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db, obj=False)
+
+    # Set campaign 3 to active
+    campaign = Campaign.query.get(3)
+    campaign.status = "active"
+    db.session.commit()
+
+    pet = {
+        "bounding_box": {"xmin": 123, "xmax": 256, "ymin": 187, "ymax": 231},
+        "label": "PET"
+    }
+    organic = {
+        "bounding_box": {"xmin": 234, "xmax": 324, "ymin": 564, "ymax": 765},
+        "label": "Organic",
+        "confidence": 0.5
+    }
+    json_payload = [
+        {"image_id": 1, "objects": [pet, organic]},
+        {"image_id": 2, "objects": [pet]}
+    ]
+
+    response = client.put(
+        "/api/v1/campaigns/3/objects", json=json_payload, headers=headers)
+    assert response.status_code == 200
+    assert response.json == {"updated": 2, "skipped": 0}
+
+    img1 = CampaignImage.query.filter(CampaignImage.image_id == 1).first()
+    object_ids = sorted(x.id for x in img1.objects)
+
+    # Same objects in a different order for image 1, changed image 2
+    json_payload = [
+        {"image_id": 1, "objects": [organic, pet]},
+        {"image_id": 2, "objects": [organic]}
+    ]
+
+    response = client.put(
+        "/api/v1/campaigns/3/objects", json=json_payload, headers=headers)
+    assert response.status_code == 200
+    assert response.json == {"updated": 1, "skipped": 1}
+
+    img1 = CampaignImage.query.filter(CampaignImage.image_id == 1).first()
+    img2 = CampaignImage.query.filter(CampaignImage.image_id == 2).first()
+    assert sorted(x.id for x in img1.objects) == object_ids
+    assert [x.label_translated for x in img2.objects] == ["Organic"]
+
 
 def test_add_objects_to_images_in_campaign_image_doesnt_exist(client, app, db,
                                                               mocker):
@@ -1333,3 +1884,186 @@ def test_add_objects_to_images_in_campaign_image_doesnt_exist(client, app, db,
 
     assert img1.objects[0].label_translated == "label1"
     assert img1.objects[1].label_translated == "label2"
+
+
+def get_objects_stream(records):
+    return "\n".join(json.dumps(x) for x in records) + "\n"
+
+
+def test_add_objects_stream(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db, obj=False)
+
+    # Set campaign 3 to active
+    campaign = Campaign.query.get(3)
+    campaign.status = "active"
+    db.session.commit()
+
+    records = [
+        {
+            "image_id": 1,
+            "objects": [
+                {
+                    "bounding_box": {
+                        "xmin": 123, "xmax": 256, "ymin": 187, "ymax": 231
+                    },
+                    "label": "PET"
+                }
+            ]
+        },
+        {
+            "image_id": 2,
+            "objects": [
+                {
+                    "bounding_box": {
+                        "xmin": 23, "xmax": 98, "ymin": 1000, "ymax": 1023
+                    },
+                    "label": "Plastic",
+                    "label_translated": None
+                }
+            ]
+        }
+    ]
+
+    response = client.put(
+        "/api/v1/campaigns/3/objects/stream?chunk_size=1",
+        data=get_objects_stream(records),
+        content_type="application/x-ndjson",
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json == {
+        "chunks": [
+            {"first_record": 0, "last_record": 0, "records": 1,
+             "updated": 1, "skipped": 0},
+            {"first_record": 1, "last_record": 1, "records": 1,
+             "updated": 1, "skipped": 0}
+        ],
+        "records": 2,
+        "updated": 2,
+        "skipped": 0,
+        "resume_from": None,
+        "error": None
+    }
+
+    img1 = CampaignImage.query.filter(CampaignImage.image_id == 1).first()
+    img2 = CampaignImage.query.filter(CampaignImage.image_id == 2).first()
+    assert [x.label_translated for x in img1.objects] == ["PET"]
+    assert [x.label_translated for x in img2.objects] == ["Plastic"]
+
+    campaign = Campaign.query.get(3)
+    assert campaign.status == "completed"
+
+
+def test_add_objects_stream_invalid_record(client, app, db, mocker):
+    """
+    In this test we verify that the chunks before an invalid record are
+    committed, and that the upload can be resumed from there.
+    """
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db, obj=False)
+
+    # Set campaign 3 to active
+    campaign = Campaign.query.get(3)
+    campaign.status = "active"
+    db.session.commit()
+
+    records = [
+        {
+            "image_id": 1,
+            "objects": [
+                {
+                    "bounding_box": {
+                        "xmin": 123, "xmax": 256, "ymin": 187, "ymax": 231
+                    },
+                    "label": "PET"
+                }
+            ]
+        },
+        {
+            "image_id": 2,
+            "objects": []
+        },
+        {
+            "image_id": 2,
+            "objects": [{"label": "Plastic"}]
+        }
+    ]
+
+    response = client.put(
+        "/api/v1/campaigns/3/objects/stream?chunk_size=1",
+        data=get_objects_stream(records),
+        content_type="application/x-ndjson",
+        headers=headers
+    )
+    assert response.status_code == 400
+    assert response.json["records"] == 2
+    assert response.json["resume_from"] == 2
+    assert response.json["error"].startswith("Record 2 is invalid")
+
+    img1 = CampaignImage.query.filter(CampaignImage.image_id == 1).first()
+    assert [x.label_translated for x in img1.objects] == ["PET"]
+
+    # Campaign is not completed after a failed upload
+    campaign = Campaign.query.get(3)
+    assert campaign.status == "active"
+
+    # Resume with a corrected record
+    records[2]["objects"][0]["bounding_box"] = {
+        "xmin": 23, "xmax": 98, "ymin": 1000, "ymax": 1023
+    }
+    response = client.put(
+        "/api/v1/campaigns/3/objects/stream?skip=2",
+        data=get_objects_stream(records),
+        content_type="application/x-ndjson",
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json["chunks"] == [
+        {"first_record": 2, "last_record": 2, "records": 1, "updated": 1,
+         "skipped": 0}
+    ]
+
+    img2 = CampaignImage.query.filter(CampaignImage.image_id == 2).first()
+    assert [x.label_translated for x in img2.objects] == ["Plastic"]
+
+    campaign = Campaign.query.get(3)
+    assert campaign.status == "completed"
+
+
+def test_add_objects_stream_image_not_in_campaign(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+
+    # Set campaign 3 to active
+    campaign = Campaign.query.get(3)
+    campaign.status = "active"
+    db.session.commit()
+
+    records = [{"image_id": 3, "objects": []}]
+
+    response = client.put(
+        "/api/v1/campaigns/3/objects/stream",
+        data=get_objects_stream(records),
+        content_type="application/x-ndjson",
+        headers=headers
+    )
+    assert response.status_code == 404
+    assert response.json["resume_from"] == 0
+    assert response.json["chunks"] == []
+
+
+def test_add_objects_stream_wrong_content_type(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+
+    response = client.put(
+        "/api/v1/campaigns/3/objects/stream",
+        json=[],
+        headers=headers
+    )
+    assert response.status_code == 415
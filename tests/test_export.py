@@ -0,0 +1,142 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from tests.shared import create_basic_testset
+from models.campaign import Campaign
+from common.export import write_coco, write_parquet
+import pyarrow.parquet as pq
+import json
+
+
+def get_objects():
+    return [
+        {
+            "image_id": 1,
+            "image_url": "path/file1.png",
+            "width": 100,
+            "height": 50,
+            "object_id": 1,
+            "label": "bottle",
+            "label_original": "fles",
+            "confidence": None,
+            "x_min": 1,
+            "x_max": 11,
+            "y_min": 2,
+            "y_max": 22
+        },
+        {
+            "image_id": 1,
+            "image_url": "path/file1.png",
+            "width": 100,
+            "height": 50,
+            "object_id": 2,
+            "label": "bag",
+            "label_original": None,
+            "confidence": 0.5,
+            "x_min": 3,
+            "x_max": 4,
+            "y_min": 5,
+            "y_max": 6
+        },
+        {
+            "image_id": 2,
+            "image_url": "path/file2.png",
+            "width": None,
+            "height": None,
+            "object_id": None,
+            "label": None,
+            "label_original": None,
+            "confidence": None,
+            "x_min": None,
+            "x_max": None,
+            "y_min": None,
+            "y_max": None
+        }
+    ]
+
+
+def test_write_coco(tmp_path):
+    path = tmp_path / "coco.json"
+    write_coco(path, iter(get_objects()), "Some campaign")
+
+    with open(path) as f:
+        coco = json.load(f)
+
+    assert coco["info"]["description"] == "Some campaign"
+    assert coco["images"] == [
+        {"id": 1, "file_name": "path/file1.png", "width": 100, "height": 50},
+        {"id": 2, "file_name": "path/file2.png", "width": None,
+         "height": None}
+    ]
+    assert coco["annotations"] == [
+        {"id": 1, "image_id": 1, "category_id": 1, "bbox": [1, 2, 10, 20],
+         "area": 200, "iscrowd": 0, "score": None},
+        {"id": 2, "image_id": 1, "category_id": 2, "bbox": [3, 5, 1, 1],
+         "area": 1, "iscrowd": 0, "score": 0.5}
+    ]
+    assert coco["categories"] == [
+        {"id": 1, "name": "bottle"},
+        {"id": 2, "name": "bag"}
+    ]
+
+
+def test_write_parquet(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXPORT_BATCH_SIZE", "2")
+    path = tmp_path / "objects.parquet"
+    write_parquet(str(path), iter(get_objects()), "Some campaign")
+
+    parquet = pq.ParquetFile(str(path))
+    assert parquet.num_row_groups == 2
+    assert parquet.schema_arrow.metadata[b"description"] == b"Some campaign"
+    assert str(parquet.schema_arrow.field("x_min").type) == "int32"
+    assert parquet.read().to_pydict() == {
+        name: [x[name] for x in get_objects()]
+        for name in parquet.schema_arrow.names
+    }
+
+
+def test_export_campaign(client, app, db, mocker):
+    now, yesterday = create_basic_testset(db)
+    campaign3 = db.session.query(Campaign).get(3)
+
+    # Read the file while it still exists
+    uploaded = {}
+
+    def upload_to_datastore(files, relative_root, target_path):
+        with open(files[0]) as f:
+            uploaded[target_path] = json.load(f)
+
+    mocker.patch(
+        "models.campaign.AzureWrapper.upload_to_datastore",
+        side_effect=upload_to_datastore
+    )
+
+    assert campaign3.export("coco")
+
+    coco = uploaded["exports/a-third-campaign"]
+    assert [x["file_name"] for x in coco["images"]] == \
+        ["path/file1.png", "otherpath/file2.png"]
+    assert [x["id"] for x in coco["annotations"]] == [1, 2, 3]
+    assert [x["name"] for x in coco["categories"]] == \
+        ["label1", "label2", "translated_label3"]
+
+
+def test_export_formats(monkeypatch):
+    monkeypatch.setenv("EXPORT_FORMATS", " parquet, csv,,coco")
+    assert Campaign.export_formats() == ["parquet", "coco"]
+
+    monkeypatch.setenv("EXPORT_FORMATS", "")
+    assert Campaign.export_formats() == []
@@ -15,10 +15,12 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import datetime
+import time
 from common.azure import AzureWrapper
+from common.cache import sas_url_ttl
 from tests.shared import get_headers, add_user, add_imagesets, add_images, \
     add_campaigns, add_image_to_campaign, add_object, create_basic_testset, \
-    add_images_campaigns, add_labeler_user
+    add_images_campaigns, add_labeler_user, count_queries
 
 
 def test_list_images(client, app, db, mocker):
@@ -177,6 +179,37 @@ def test_list_images_pagination(client, app, db, mocker):
     assert response.json == expected
 
 
+def test_list_images_keyset_pagination(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now = datetime.datetime.now()
+    user = add_user(db)
+    imgset1, imgset2, imgset3 = add_imagesets(db, user, now)
+    img1, img2, img3 = add_images(db, imgset1, now)
+    db.session.commit()
+
+    response = client.get("/api/v1/images?after_id=1&limit=1",
+                          headers=headers)
+    assert response.status_code == 200
+    assert [x["image_id"] for x in response.json["images"]] == [2]
+    assert response.json["pagination"]["limit"] == 1
+    cursor = response.json["pagination"]["next"]
+    assert cursor is not None
+
+    response = client.get(f"/api/v1/images?cursor={cursor}&limit=1",
+                          headers=headers)
+    assert response.status_code == 200
+    assert [x["image_id"] for x in response.json["images"]] == [3]
+    assert response.json["pagination"] == {"limit": 1, "next": None}
+
+
+def test_list_images_invalid_cursor(client, app, db, mocker):
+    headers = get_headers(db)
+
+    response = client.get("/api/v1/images?cursor=invalid", headers=headers)
+    assert response.status_code == 400
+
+
 def test_list_objects_in_image_prioritize_default_match_in_first(
         client, app, db, mocker):
     """
@@ -372,6 +405,7 @@ def test_list_objects_in_image_prioritize_provided_match_not_in_first(
     obj2 = add_object(db, now, ci1, 'label2', None, None, [2, 3, 4, 5])
 
     ci2.labeled = False
+    campaign3.labeled_count -= 1
     db.session.commit()
 
     expected = [
@@ -565,3 +599,85 @@ def test_images_get_link_with_user_key(client, app, db, mocker):
         expires=datetime.datetime(2020, 10, 26, 12, 34, 56),
         permissions=["read"]
     )
+
+
+def test_images_get_link_with_campaign_key_other_campaign(
+        client, app, db, mocker):
+    # Add labeling user on campaign 3, image 3 is only part of campaign 1
+    headers = add_labeler_user(db, "campaign", 3)
+
+    now, yesterday = create_basic_testset(db)
+
+    response = client.get("/api/v1/images/3", headers=headers)
+
+    assert response.status_code == 401
+
+
+def test_images_get_link_doesnt_exist(client, app, db, mocker):
+    headers = add_labeler_user(db, "campaign", 3)
+
+    now, yesterday = create_basic_testset(db)
+
+    response = client.get("/api/v1/images/10", headers=headers)
+
+    assert response.status_code == 404
+
+
+def test_images_get_link_with_campaign_key_queries(client, app, db, mocker):
+    headers = add_labeler_user(db, "campaign", 3)
+
+    now, yesterday = create_basic_testset(db)
+
+    mocker.patch(
+        "models.image.AzureWrapper.get_sas_url",
+        return_value="url"
+    )
+
+    with count_queries(db) as queries:
+        response = client.get("/api/v1/images/1", headers=headers)
+
+    assert response.status_code == 303
+
+    # One query to authenticate, one to get the image and check access
+    assert len(queries) == 2
+
+
+def test_images_get_link_cached(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now, yesterday = create_basic_testset(db)
+
+    mocker.patch(
+        "models.image.AzureWrapper.get_sas_url",
+        side_effect=["url1", "url2", "url3"]
+    )
+
+    # Repeated views of an image get the same URL
+    response = client.get("/api/v1/images/1", headers=headers)
+    assert response.headers["Location"].endswith("url1")
+    response = client.get("/api/v1/images/1", headers=headers)
+    assert response.headers["Location"].endswith("url1")
+    response = client.get("/api/v1/images/2", headers=headers)
+    assert response.headers["Location"].endswith("url2")
+    assert AzureWrapper.get_sas_url.call_count == 2
+
+    # After half the validity of the token (7 days), a new URL is generated
+    monotonic = time.monotonic()
+    mocker.patch(
+        "common.cache.time.monotonic",
+        return_value=monotonic + 3.5 * 86400 + 1
+    )
+    response = client.get("/api/v1/images/1", headers=headers)
+    assert response.headers["Location"].endswith("url3")
+
+
+def test_sas_url_ttl(monkeypatch):
+    monkeypatch.setenv("IMAGE_READ_TOKEN_VALID_DAYS", "2")
+    monkeypatch.setenv("SAS_URL_CACHE_REFRESH_FRACTION", "0.5")
+    assert sas_url_ttl() == 86400
+
+    # URLs are never cached for longer than their token is valid
+    monkeypatch.setenv("SAS_URL_CACHE_REFRESH_FRACTION", "1.5")
+    assert sas_url_ttl() == 2 * 86400
+    monkeypatch.setenv("SAS_URL_CACHE_REFRESH_FRACTION", "-1")
+    assert sas_url_ttl() == 0
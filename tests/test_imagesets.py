@@ -17,6 +17,7 @@
 import datetime
 from tests.shared import get_headers, add_user, add_imagesets, add_images
 from models.image import ImageSet, Image
+from models.job import Job
 from common.azure import AzureWrapper
 
 
@@ -245,10 +246,6 @@ def test_change_imageset_status(client, app, db, mocker):
     user = add_user(db)
     imgset1, imgset2, imgset3 = add_imagesets(db, user, now)
 
-    mocker.patch(
-        "models.image.ImageSet.finish_set"
-    )
-
     json_payload = {
         'new_status': 'finished'
     }
@@ -261,7 +258,10 @@ def test_change_imageset_status(client, app, db, mocker):
     assert response.json == "ok"
     assert imgset1.date_finished is not None
 
-    ImageSet.finish_set.assert_called_once()
+    job = Job.query.one()
+    assert job.type == "finish_set"
+    assert job.payload == {"imageset_id": 1}
+    assert job.status == "queued"
 
 
 def test_change_imageset_status_invalid(client, app, db, mocker):
@@ -384,6 +384,29 @@ def test_set_finish_copy_failed(client, app, db, mocker):
     assert imgset1.blobstorage_path == '/some/otherpath'
 
 
+def test_set_finish_already_moved(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now = datetime.datetime.now()
+    user = add_user(db)
+    imgset1, imgset2, imgset3 = add_imagesets(db, user, now)
+    imgset1.blobstorage_path = "upload-container/uploads/some-image-set"
+    db.session.commit()
+
+    mocker.patch(
+        "models.image.AzureWrapper.copy_contents"
+    )
+    mocker.patch(
+        "models.image.AzureWrapper.delete_container"
+    )
+
+    # A retry after the images were stored does nothing
+    assert imgset1.finish_set(app, db, 1)
+
+    AzureWrapper.copy_contents.assert_not_called()
+    AzureWrapper.delete_container.assert_not_called()
+
+
 def test_list_images_in_set(client, app, db, mocker):
     headers = get_headers(db)
 
@@ -512,6 +535,29 @@ def test_list_images_in_set_pagination(client, app, db, mocker):
     assert response.json == expected
 
 
+def test_list_images_in_set_keyset_pagination(client, app, db, mocker):
+    headers = get_headers(db)
+
+    now = datetime.datetime.now()
+    user = add_user(db)
+    imgset1, imgset2, imgset3 = add_imagesets(db, user, now)
+    img1, img2, img3 = add_images(db, imgset1, now)
+    db.session.commit()
+
+    response = client.get(
+        "/api/v1/image_sets/1/images?limit=1", headers=headers)
+    assert response.status_code == 200
+    assert [x["image_id"] for x in response.json["images"]] == [2]
+    cursor = response.json["pagination"]["next"]
+
+    response = client.get(
+        f"/api/v1/image_sets/1/images?cursor={cursor}&limit=1",
+        headers=headers)
+    assert response.status_code == 200
+    assert [x["image_id"] for x in response.json["images"]] == [3]
+    assert response.json["pagination"]["next"] is None
+
+
 def test_add_images_to_set_by_id(client, app, db, mocker):
     headers = get_headers(db)
 
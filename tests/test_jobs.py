@@ -0,0 +1,205 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from tests.shared import get_headers
+from models.job import Job
+import datetime
+import time
+import worker
+
+
+def test_claim_job(client, app, db, mocker):
+    job1 = Job.enqueue("finish_set", {"imageset_id": 1})
+    job2 = Job.enqueue("finish_set", {"imageset_id": 2})
+    job2.run_after = datetime.datetime.now() + datetime.timedelta(days=1)
+    db.session.commit()
+
+    job = Job.claim()
+    assert job.id == job1.id
+    assert job.status == "running"
+    assert job.attempts == 1
+    assert job.locked_until is not None
+
+    # The other job is not due yet, and the first one is leased
+    assert Job.claim() is None
+
+
+def test_claim_job_expired_lease(client, app, db, mocker):
+    job = Job.enqueue("finish_set", {"imageset_id": 1})
+    job.status = "running"
+    job.attempts = 1
+    job.locked_until = datetime.datetime.now() - datetime.timedelta(days=1)
+    db.session.commit()
+
+    # The abandoned attempt counts as failed, so the job is retried after
+    # the backoff
+    assert Job.claim() is None
+
+    job = Job.query.one()
+    assert job.status == "queued"
+    assert job.attempts == 1
+    assert job.last_error == "Lease expired"
+    assert job.locked_until is None
+    assert job.run_after > job.date_created
+
+
+def test_claim_job_expired_lease_max_attempts(client, app, db, mocker):
+    job = Job.enqueue("finish_set", {"imageset_id": 1})
+    job.status = "running"
+    job.attempts = job.max_attempts
+    job.locked_until = datetime.datetime.now() - datetime.timedelta(days=1)
+    db.session.commit()
+
+    assert Job.claim() is None
+
+    job = Job.query.one()
+    assert job.status == "failed"
+    assert job.attempts == job.max_attempts
+    assert job.last_error == "Lease expired"
+    assert job.date_finished is not None
+
+
+def test_run_job(client, app, db, mocker):
+    handler = mocker.Mock(return_value=True)
+    mocker.patch.dict(worker.HANDLERS, {"finish_set": handler})
+
+    Job.enqueue("finish_set", {"imageset_id": 1})
+
+    assert worker.run_next_job()
+    handler.assert_called_once_with({"imageset_id": 1})
+
+    job = Job.query.one()
+    assert job.status == "done"
+    assert job.date_finished is not None
+    assert job.last_error is None
+
+    assert not worker.run_next_job()
+
+
+def test_renew_lease(client, app, db, mocker):
+    job = Job.enqueue("finish_set", {"imageset_id": 1})
+    job = Job.claim()
+    job.locked_until = datetime.datetime.now() - datetime.timedelta(days=1)
+    db.session.commit()
+
+    Job.renew_lease(job.id, db.engine)
+
+    db.session.refresh(job)
+    assert job.locked_until > job.date_created
+    assert Job.claim() is None
+
+
+def test_run_job_heartbeat(client, app, db, mocker):
+    mocker.patch("models.job.Job.lease_seconds", return_value=0.03)
+    renew = mocker.patch("models.job.Job.renew_lease")
+    handler = mocker.Mock(side_effect=lambda payload: time.sleep(0.2))
+    mocker.patch.dict(worker.HANDLERS, {"finish_set": handler})
+
+    job = Job.enqueue("finish_set", {"imageset_id": 1})
+
+    assert worker.run_next_job()
+    assert renew.call_count >= 2
+    renew.assert_called_with(job.id, db.engine)
+
+    # The lease is no longer renewed once the job is done
+    calls = renew.call_count
+    time.sleep(0.1)
+    assert renew.call_count == calls
+
+
+def test_run_job_retry(client, app, db, mocker):
+    handler = mocker.Mock(side_effect=ValueError("Storage unavailable"))
+    mocker.patch.dict(worker.HANDLERS, {"finish_set": handler})
+
+    Job.enqueue("finish_set", {"imageset_id": 1})
+
+    assert worker.run_next_job()
+
+    job = Job.query.one()
+    assert job.status == "queued"
+    assert job.attempts == 1
+    assert job.last_error == "ValueError: Storage unavailable"
+    assert job.run_after > job.date_created
+
+    # The job is not retried before the backoff has passed
+    assert not worker.run_next_job()
+    handler.assert_called_once()
+
+
+def test_run_job_failed(client, app, db, mocker):
+    handler = mocker.Mock(return_value=False)
+    mocker.patch.dict(worker.HANDLERS, {"finish_set": handler})
+
+    job = Job.enqueue("finish_set", {"imageset_id": 1})
+    job.attempts = job.max_attempts - 1
+    db.session.commit()
+
+    assert worker.run_next_job()
+
+    job = Job.query.one()
+    assert job.status == "failed"
+    assert job.attempts == job.max_attempts
+    assert job.last_error == "Job reported failure"
+    assert job.date_finished is not None
+
+
+def test_run_job_unknown_type(client, app, db, mocker):
+    Job.enqueue("unknown", {})
+
+    assert worker.run_next_job()
+
+    job = Job.query.one()
+    assert job.status == "queued"
+    assert job.last_error == "ValueError: Unknown job type unknown"
+
+
+def test_get_job(client, app, db, mocker):
+    headers = get_headers(db)
+
+    job = Job.enqueue("finish_campaign", {"campaign_id": 3})
+
+    response = client.get(f"/api/v1/jobs/{job.id}", headers=headers)
+    assert response.status_code == 200
+    assert response.json["job_id"] == job.id
+    assert response.json["type"] == "finish_campaign"
+    assert response.json["payload"] == {"campaign_id": 3}
+    assert response.json["status"] == "queued"
+    assert response.json["attempts"] == 0
+
+    response = client.get("/api/v1/jobs/1234", headers=headers)
+    assert response.status_code == 404
+
+
+def test_list_jobs(client, app, db, mocker):
+    headers = get_headers(db)
+
+    job1 = Job.enqueue("finish_campaign", {"campaign_id": 3})
+    job2 = Job.enqueue("finish_set", {"imageset_id": 1})
+    job1.status = "failed"
+    db.session.commit()
+
+    response = client.get("/api/v1/jobs", headers=headers)
+    assert response.status_code == 200
+    assert response.json["pagination"]["total"] == 2
+    assert [x["job_id"] for x in response.json["jobs"]] == [job2.id, job1.id]
+
+    response = client.get("/api/v1/jobs?status=failed", headers=headers)
+    assert response.status_code == 200
+    assert [x["job_id"] for x in response.json["jobs"]] == [job1.id]
+
+    response = client.get("/api/v1/jobs?type=finish_set", headers=headers)
+    assert response.status_code == 200
+    assert [x["job_id"] for x in response.json["jobs"]] == [job2.id]
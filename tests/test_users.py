@@ -0,0 +1,130 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from tests.shared import get_headers, add_labeler_user
+from models.user import User
+import bcrypt
+
+
+def test_add_users(client, app, db, mocker):
+    headers = get_headers(db)
+
+    json_payload = [
+        {
+            "email": "labeler1@example.com",
+            "roles": [
+                {"role": "labeler", "subject_type": "campaign",
+                 "subject_id": 1},
+                {"role": "labeler", "subject_type": "campaign",
+                 "subject_id": 2}
+            ]
+        },
+        {
+            "email": "admin@example.com",
+            "roles": [{"role": "image-admin"}]
+        },
+        {
+            "email": "nobody@example.com"
+        }
+    ]
+
+    response = client.post("/api/v1/users", json=json_payload,
+                           headers=headers)
+    assert response.status_code == 200
+    assert [x["email"] for x in response.json] == [
+        "labeler1@example.com", "admin@example.com", "nobody@example.com"]
+
+    for item in response.json:
+        user = User.find_by_api_key(item["access_token"]["apikey"])
+        assert user is not None and user.email == item["email"]
+        assert bcrypt.checkpw(
+            item["access_token"]["apisecret"].encode(),
+            user.API_SECRET
+        )
+
+    user = User.query.filter(User.email == "labeler1@example.com").first()
+    assert user.has_role_on_subject("labeler", "campaign", 1)
+    assert user.has_role_on_subject("labeler", "campaign", 2)
+    assert not user.has_role("image-admin")
+
+    user = User.query.filter(User.email == "admin@example.com").first()
+    assert user.has_role("image-admin")
+
+    user = User.query.filter(User.email == "nobody@example.com").first()
+    assert len(user.roles) == 0
+
+
+def test_add_users_existing_user(client, app, db, mocker):
+    headers = get_headers(db)
+    add_labeler_user(db, "campaign", 1)
+
+    json_payload = [
+        {
+            "email": "labeler@example.com",
+            "roles": [
+                {"role": "labeler", "subject_type": "campaign",
+                 "subject_id": 1},
+                {"role": "labeler", "subject_type": "campaign",
+                 "subject_id": 2}
+            ]
+        }
+    ]
+
+    response = client.post("/api/v1/users", json=json_payload,
+                           headers=headers)
+    assert response.status_code == 200
+
+    # Existing key is returned, secret is not known
+    assert response.json == [
+        {
+            "email": "labeler@example.com",
+            "access_token": {
+                "apikey": "label-key",
+                "apisecret": None
+            }
+        }
+    ]
+
+    user = User.query.filter(User.email == "labeler@example.com").first()
+    assert len(user.roles) == 2
+    assert user.has_role_on_subject("labeler", "campaign", 2)
+
+
+def test_add_users_invalid_subject(client, app, db, mocker):
+    headers = get_headers(db)
+
+    json_payload = [
+        {
+            "email": "labeler1@example.com",
+            "roles": [{"role": "labeler", "subject_type": "campaign"}]
+        }
+    ]
+
+    response = client.post("/api/v1/users", json=json_payload,
+                           headers=headers)
+    assert response.status_code == 422
+    assert User.query.filter(User.email == "labeler1@example.com").first() \
+        is None
+
+
+def test_add_users_not_authorized(client, app, db, mocker):
+    headers = add_labeler_user(db, "campaign", 1)
+
+    json_payload = [{"email": "labeler1@example.com"}]
+
+    response = client.post("/api/v1/users", json=json_payload,
+                           headers=headers)
+    assert response.status_code == 401
@@ -0,0 +1,152 @@
+# LabelAPI - Server program that provides API to manage training sets for machine learning image recognition models
+# Copyright (C) 2020-2021 The Ocean Cleanup™
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Background worker, running the jobs in the job queue (see models.job.Job).
+Start one or more next to the API:
+    python -m worker
+"""
+
+from common.db import db
+from flask import current_app
+from models.job import Job
+from models.campaign import Campaign
+from models.image import ImageSet
+from threading import Event, Thread
+import logging
+import time
+import os
+
+logger = logging.getLogger("label-api")
+
+
+def finish_campaign(payload):
+    campaign = Campaign.query.get(payload["campaign_id"])
+    return campaign.finish_campaign(
+        current_app._get_current_object(),
+        db,
+        campaign.id,
+        campaign.title
+    )
+
+
+def export_campaign(payload):
+    campaign = Campaign.query.get(payload["campaign_id"])
+    return campaign.export(payload["format"])
+
+
+def finish_set(payload):
+    imageset = ImageSet.query.get(payload["imageset_id"])
+    return imageset.finish_set(
+        current_app._get_current_object(),
+        db,
+        imageset.id
+    )
+
+
+# Functions that run a job, by job type. They are called with the payload of
+# the job, within an app context. A job fails if the function raises an
+# exception or returns False.
+HANDLERS = {
+    "finish_campaign": finish_campaign,
+    "export_campaign": export_campaign,
+    "finish_set": finish_set
+}
+
+
+def renew_lease(job_id, engine, stopped):
+    """
+    Renew the lease of a job every third of JOB_LEASE_SECONDS, until stopped
+    is set.
+    """
+    while not stopped.wait(Job.lease_seconds() / 3):
+        try:
+            Job.renew_lease(job_id, engine)
+        except Exception:
+            logger.exception(f"Failed to renew the lease of job {job_id}")
+
+
+def run_job(job):
+    """
+    Run a claimed job, and register the result.
+
+    :param job:     The job, as returned by Job.claim
+    :returns:       Boolean indicating success
+    """
+    job_id = job.id
+    handler = HANDLERS.get(job.type)
+
+    # Renew the lease while the job runs, so long running jobs are not
+    # claimed by another worker
+    stopped = Event()
+    heartbeat = Thread(
+        target=renew_lease,
+        args=(job_id, db.engine, stopped),
+        daemon=True
+    )
+    heartbeat.start()
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job type {job.type}")
+        result = handler(job.payload)
+        error = "Job reported failure" if result is False else None
+    except Exception as e:
+        logger.exception(f"Exception in {job.type} job {job_id}")
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        stopped.set()
+        heartbeat.join()
+
+    # The handler may have ended the session, so load the job again
+    db.session.rollback()
+    job = Job.query.get(job_id)
+    if error is not None:
+        job.fail(error)
+        return False
+
+    job.complete()
+    return True
+
+
+def run_next_job():
+    """
+    Claim and run the next job that is due, if any.
+
+    :returns:   Boolean indicating if a job was run
+    """
+    job = Job.claim()
+    if job is None:
+        return False
+
+    run_job(job)
+    return True
+
+
+def main():
+    from main import app
+
+    poll_interval = float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", 5))
+
+    logger.info("Worker started")
+    while True:
+        with app.app_context():
+            ran = run_next_job()
+        if not ran:
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    main()